@@ -0,0 +1,258 @@
+import os
+import time
+import sqlite3
+import asyncio
+import traceback
+import warnings
+from collections import namedtuple
+import numpy as np
+from dotenv import load_dotenv
+from weather_client import HOURLY_VARIABLES
+from forecast_cache import cell_center, next_run_at
+from forecast_stats import hourly_block, aggregate_block
+from geocoder import place_name
+from send_queue import BROADCAST
+from subscriptions import SUBSCRIPTIONS_DB
+from state_backend import StateBackendError
+
+# ============ CONFIGURATION ============
+load_dotenv()
+# name:metric>threshold, where metric is an hourly variable or a daily stat
+ALERT_RULES = os.getenv(
+    "ALERT_RULES",
+    "heat:temperature_2m>35,frost:temperature_2m<10,swing:temp_swing>15"
+)
+ALERTS_DB = os.getenv("ALERTS_DB", SUBSCRIPTIONS_DB)
+ALERT_FETCH_CONCURRENCY = int(os.getenv("ALERT_FETCH_CONCURRENCY", 200))
+
+AlertRule = namedtuple("AlertRule", "name metric op threshold")
+
+SHARED_ACTIVE = "alerts:active"   # "cell_lat,cell_lon,rule" -> announced event, with a shared backend
+
+ALERT_MESSAGES = {
+    "heat": "🔥 Heat stress: up to {value:.0f}°C from {when}",
+    "frost": "❄️ Frost risk: down to {value:.0f}°C from {when}",
+    "swing": "📊 Temperature swing of {value:.0f}°C on {when}",
+}
+ALERT_MESSAGE = "⚠️ {name}: {value:.1f} from {when}"
+
+
+def parse_rules(spec):
+    """'heat:temperature_2m>35,frost:temperature_2m<10' -> list of AlertRule"""
+    rules = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, condition = item.partition(":")
+        op = ">" if ">" in condition else "<"
+        metric, _, threshold = condition.partition(op)
+        rules.append(AlertRule(name.strip(), metric.strip(), op, float(threshold)))
+    return rules
+
+
+# ============ VECTORIZED EVALUATION ============
+def daily_metrics(block):
+    """Daily stats from a (cells, variables, days, 24) block, plus the day's temperature swing"""
+    daily = aggregate_block(block)
+    daily["temp_swing"] = daily["temp_max"] - daily["temp_min"]
+    return daily
+
+
+def evaluate(rules, forecasts, now=None):
+    """{rule name: (triggered, first hour, value)} arrays over cells, upcoming hours only"""
+    now = time.time() if now is None else now
+    days = max(f.hours for f in forecasts) // 24
+    block = np.empty((len(forecasts), len(HOURLY_VARIABLES), days * 24), dtype=np.float32)
+    for i, forecast in enumerate(forecasts):
+        hourly_block(forecast, days, out=block[i])
+
+    # Hours already gone (the forecast starts at local midnight) never alert
+    starts = np.array([f.start for f in forecasts], dtype=np.float64)
+    elapsed = np.clip((now - starts) // 3600, 0, None)[:, None]
+    hour = np.arange(days * 24)
+    upcoming = hour[None, :] >= elapsed
+    daily = None
+
+    results = {}
+    for rule in rules:
+        if rule.metric in HOURLY_VARIABLES:
+            values = block[:, HOURLY_VARIABLES.index(rule.metric)]
+            mask = upcoming
+            step = 1
+        else:
+            if daily is None:
+                daily = daily_metrics(block.reshape(len(forecasts), len(HOURLY_VARIABLES), days, 24))
+            values = daily[rule.metric]
+            mask = upcoming.reshape(len(forecasts), days, 24).any(axis=-1)
+            step = 24
+        with np.errstate(invalid="ignore"):
+            hits = ((values > rule.threshold) if rule.op == ">" else (values < rule.threshold)) & mask
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            masked = np.where(hits, values, np.nan)
+            extreme = np.nanmax(masked, axis=-1) if rule.op == ">" else np.nanmin(masked, axis=-1)
+        results[rule.name] = (hits.any(axis=-1), hits.argmax(axis=-1) * step, extreme)
+    return results
+
+
+# ============ ALERT ENGINE ============
+class AlertEngine:
+    """After every model run, checks each subscribed cell once and pushes newly crossed thresholds"""
+
+    def __init__(self, registry, get_forecast, sender, rules=None, path=ALERTS_DB, shared=None):
+        self.registry = registry
+        self.shared = shared
+        self.get_forecast = get_forecast
+        self.sender = sender
+        self.rules = parse_rules(ALERT_RULES) if rules is None else rules
+        self.path = path
+        self._db = None
+        self._active = {}     # (cell, rule name) -> start of the announced crossing
+        self._task = None
+        self.checks = 0
+        self.sent = 0
+        self.failed = 0
+        self.last_check_seconds = 0.0
+
+    def load(self):
+        self._db = sqlite3.connect(self.path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS alerts ("
+            "cell_lat INTEGER, cell_lon INTEGER, rule TEXT, event TEXT, "
+            "PRIMARY KEY (cell_lat, cell_lon, rule))"
+        )
+        self._db.commit()
+        for lat, lon, rule, event in self._db.execute("SELECT cell_lat, cell_lon, rule, event FROM alerts"):
+            self._active[((lat, lon), rule)] = event
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                # One replica checks each model run
+                if await self.registry.claim(f"alerts:{int(next_run_at())}", ttl=3600):
+                    await self.registry.sync()
+                    await self._load_shared()
+                    await self.check()
+            except Exception:
+                traceback.print_exc()
+            await asyncio.sleep(max(1, next_run_at() - time.time()))
+
+    async def check(self):
+        """Fetch every subscribed cell, evaluate all rules in one pass and send what's new"""
+        cells = list(self.registry.cells())
+        if not cells or not self.rules:
+            return
+        started = time.time()
+        fetch_slots = asyncio.Semaphore(ALERT_FETCH_CONCURRENCY)
+
+        async def fetch(cell):
+            async with fetch_slots:
+                try:
+                    return await self.get_forecast(*cell_center(cell))
+                except Exception:
+                    return None
+
+        forecasts = await asyncio.gather(*(fetch(cell) for cell in cells))
+        loaded = [(cell, f) for cell, f in zip(cells, forecasts) if f is not None and f.hours >= 24]
+        if not loaded:
+            return
+        results = evaluate(self.rules, [f for _, f in loaded])
+
+        new, announced, cleared = {}, [], []
+        for rule in self.rules:
+            triggered, first_hour, extreme = results[rule.name]
+            for i, (cell, forecast) in enumerate(loaded):
+                key = (cell, rule.name)
+                if not triggered[i]:
+                    if key in self._active:
+                        cleared.append(key)
+                    continue
+                # One alert per crossing: stay quiet until the cell drops back below the threshold
+                if key in self._active:
+                    continue
+                when = forecast.time(int(first_hour[i]))
+                self._active[key] = when.strftime("%Y-%m-%d %H:%M")
+                announced.append(key)
+                template = ALERT_MESSAGES.get(rule.name, ALERT_MESSAGE)
+                new.setdefault(cell, []).append(template.format(
+                    name=rule.name, value=float(extreme[i]),
+                    when=when.strftime("%a %d %b" if rule.metric not in HOURLY_VARIABLES else "%a %I %p")
+                ))
+        for key in cleared:
+            del self._active[key]
+        if self.shared is not None:
+            await self._save_shared(announced, cleared)
+        else:
+            self._save(announced, cleared)
+
+        count = 0
+        for cell, lines in new.items():
+            text = f"🚨 Weather alert for {place_name(*cell_center(cell))}\n" + "\n".join(lines)
+            for chat_id in list(self.registry.subscribers(cell)):
+                future = self.sender.submit(chat_id, "send_message", BROADCAST, text=text)
+                future.add_done_callback(self._count)
+                count += 1
+        self.checks += 1
+        self.last_check_seconds = time.time() - started
+        print(f"🚨 Alert check: {len(loaded)} cells, {len(new)} with new alerts, "
+              f"{count} messages queued in {self.last_check_seconds:.1f}s")
+
+    def _save(self, announced, cleared):
+        if self._db is None:
+            return
+        self._db.executemany(
+            "DELETE FROM alerts WHERE cell_lat = ? AND cell_lon = ? AND rule = ?",
+            [(cell[0], cell[1], rule) for cell, rule in cleared]
+        )
+        self._db.executemany(
+            "INSERT OR REPLACE INTO alerts VALUES (?, ?, ?, ?)",
+            [(cell[0], cell[1], rule, self._active[(cell, rule)]) for cell, rule in announced]
+        )
+        self._db.commit()
+
+    async def _load_shared(self):
+        """Crossings announced by whichever replica checked the previous runs"""
+        if self.shared is None:
+            return
+        active = {}
+        for field, event in (await self.shared.hgetall(SHARED_ACTIVE)).items():
+            lat, lon, rule = field.decode().split(",")
+            active[((int(lat), int(lon)), rule)] = event.decode()
+        self._active = active
+
+    async def _save_shared(self, announced, cleared):
+        try:
+            for (lat, lon), rule in cleared:
+                await self.shared.hdel(SHARED_ACTIVE, f"{lat},{lon},{rule}")
+            for (lat, lon), rule in announced:
+                await self.shared.hset(SHARED_ACTIVE, f"{lat},{lon},{rule}", self._active[((lat, lon), rule)])
+        except StateBackendError as e:
+            print(f"⚠️ Alert state not shared: {e}")
+
+    def _count(self, future):
+        if future.cancelled() or future.exception() is not None:
+            self.failed += 1
+        else:
+            self.sent += 1
+
+    def stats(self):
+        return {
+            "rules": [rule.name for rule in self.rules],
+            "checks": self.checks,
+            "sent": self.sent,
+            "failed": self.failed,
+            "active": len(self._active),
+            "last_check_seconds": round(self.last_check_seconds, 2)
+        }
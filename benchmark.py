@@ -0,0 +1,376 @@
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import subprocess
+from collections import defaultdict, deque
+from urllib.parse import parse_qsl
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from state_backend import RespServer
+from set_webhook import SECRET_HEADER
+
+# ============ CONFIGURATION ============
+BENCH_TOKEN = "123456:BENCHMARK"
+BENCH_SECRET = "benchmark-secret"
+BENCH_BASELINE = "bench_baseline.json"
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+ENTRY_POINTS = {"webhook": ["main.py", "webhook"], "polling": ["main.py", "polling"]}
+FORECAST_START = 1760745600   # fixed epoch so every run formats the same data
+
+
+# ============ FAKE OPEN-METEO ============
+class FakeOpenMeteo:
+    """Open-Meteo stand-in with configurable latency and failure rate"""
+
+    def __init__(self, latency=0.05, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self.points = 0
+        self.failures = 0
+
+    @staticmethod
+    def forecast(lat, lon):
+        hours = range(72)
+        return {
+            "latitude": lat, "longitude": lon, "utc_offset_seconds": 19800,
+            "hourly": {
+                "time": [FORECAST_START - 19800 + h * 3600 for h in hours],
+                "temperature_2m": [22 + 12 * ((h % 24) / 24) for h in hours],
+                "precipitation": [0.4 if h % 24 in (15, 16) else 0.0 for h in hours],
+                "relative_humidity_2m": [60] * 72,
+                "wind_speed_10m": [6] * 72,
+                "et0_fao_evapotranspiration": [0.2] * 72,
+            }
+        }
+
+    async def endpoint(self, request):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            self.failures += 1
+            return JSONResponse({"error": True, "reason": "benchmark failure"}, status_code=500)
+        lats = [float(v) for v in request.query_params["latitude"].split(",")]
+        lons = [float(v) for v in request.query_params["longitude"].split(",")]
+        self.points += len(lats)
+        body = [self.forecast(lat, lon) for lat, lon in zip(lats, lons)]
+        return JSONResponse(body if len(body) > 1 else body[0])
+
+
+# ============ FAKE TELEGRAM ============
+class FakeTelegram:
+    """Bot API stand-in: records replies and serves queued updates to getUpdates"""
+
+    def __init__(self):
+        self.updates = deque()              # updates not yet confirmed by a getUpdates offset
+        self._arrived = asyncio.Event()
+        self.replies = defaultdict(deque)   # chat_id -> reply times, in order
+        self.errors = defaultdict(deque)
+        self.polls = 0
+        self.methods = defaultdict(int)
+
+    def push(self, update):
+        self.updates.append(update)
+        self._arrived.set()
+
+    async def endpoint(self, request):
+        method = request.path_params["method"]
+        self.methods[method] += 1
+        params = self._params(request.headers.get("content-type", ""), await request.body())
+
+        if method == "getMe":
+            return self._ok({"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"})
+        if method == "getUpdates":
+            self.polls += 1
+            return self._ok(await self._get_updates(params))
+        if method == "sendMessage":
+            chat_id = int(params["chat_id"])
+            text = params.get("text", "")
+            if "Meghdoot Weather" in text:
+                self.replies[chat_id].append(time.perf_counter())
+            elif text.startswith("❌"):
+                self.errors[chat_id].append(time.perf_counter())
+            return self._ok({"message_id": 1, "date": int(time.time()), "text": text,
+                             "chat": {"id": chat_id, "type": "private"}})
+        return self._ok(True)
+
+    @staticmethod
+    def _params(content_type, body):
+        """PTB posts url-encoded forms (multipart only for uploads, which the benchmark ignores)"""
+        if content_type.startswith("application/json"):
+            return json.loads(body or b"{}")
+        if content_type.startswith("multipart/"):
+            return {}
+        return dict(parse_qsl(body.decode()))
+
+    async def _get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        deadline = time.monotonic() + min(float(params.get("timeout") or 0), 1.0)
+        while self.updates and self.updates[0]["update_id"] < offset:
+            self.updates.popleft()
+        while True:
+            batch = [u for u in self.updates if u["update_id"] >= offset][:limit]
+            if batch or time.monotonic() >= deadline:
+                return batch
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                pass
+
+    @staticmethod
+    def _ok(result):
+        return JSONResponse({"ok": True, "result": result})
+
+
+# ============ HELPERS ============
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def serve(app, port):
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port,
+                                          log_level="warning", lifespan="off"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server, task
+
+
+def location_update(update_id, chat_id, lat, lon):
+    user = {"id": chat_id, "is_bot": False, "first_name": "Farmer"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"}, "from": user,
+            "location": {"latitude": lat, "longitude": lon}
+        }
+    }
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+# ============ BENCHMARK RUN ============
+async def run(mode, args):
+    """Start fakes, launch the entry point as a subprocess (one per replica), replay updates and measure"""
+    telegram, weather = FakeTelegram(), FakeOpenMeteo(args.om_latency, args.om_failure)
+    fake_port = free_port()
+    bot_ports = [free_port() for _ in range(args.replicas)]
+    fakes = Starlette(routes=[
+        Route("/bot{token}/{method}", telegram.endpoint, methods=["GET", "POST"]),
+        Route("/v1/forecast", weather.endpoint),
+    ])
+    server, server_task = await serve(fakes, fake_port)
+    state = None
+    if args.replicas > 1:
+        # Replicas share cache, fetch locks and update dedupe through a Redis stand-in
+        state = RespServer()
+        state_port = await state.start(port=0)
+
+    env = dict(os.environ,
+               TELEGRAM_TOKEN=BENCH_TOKEN, WEATHER_API_KEY="benchmark", WEBHOOK_SECRET=BENCH_SECRET,
+               TELEGRAM_API_URL=f"http://127.0.0.1:{fake_port}/bot",
+               WEATHER_URL=f"http://127.0.0.1:{fake_port}/v1/forecast",
+               FORECAST_STORE="", CHAT_STATE_PATH="", PREFETCH_STATE_PATH="",
+               SUBSCRIPTIONS_DB=os.path.join(args.workdir, "bench_subscriptions.db"),
+               ALERTS_DB=os.path.join(args.workdir, "bench_subscriptions.db"))
+    env.pop("RAILWAY_STATIC_URL", None)
+    env.pop("WEBHOOK_BASE_URL", None)
+    env.pop("STATE_BACKEND_URL", None)
+    if state is not None:
+        env["STATE_BACKEND_URL"] = f"redis://127.0.0.1:{state_port}"
+    if not args.real_send_limits:
+        # Measure the bot, not Telegram's flood limits
+        env.update(SEND_GLOBAL_RATE="100000", SEND_GLOBAL_BURST="100000",
+                   SEND_CHAT_RATE="1000", SEND_CHAT_BURST="1000")
+    log = open(os.path.join(args.workdir, f"bench_{mode}.log"), "w")
+    bots = [subprocess.Popen([sys.executable, *ENTRY_POINTS[mode]], cwd=REPO_DIR, env=dict(env, PORT=str(port)),
+                             stdout=log, stderr=subprocess.STDOUT) for port in bot_ports]
+
+    sent = defaultdict(deque)   # chat_id -> send times, in order
+    latencies, failed = [], 0
+    try:
+        async with httpx.AsyncClient(timeout=30) as client:
+            started = time.perf_counter()
+            for bot, bot_port in zip(bots, bot_ports):
+                await wait_ready(mode, client, bot, bot_port, telegram, started)
+            print(f"⏱️ {mode}: ready in {time.perf_counter() - started:.2f}s")
+
+            # Farms spread over a fixed set of forecast cells, as in real traffic
+            cells = [(random.uniform(8, 32), random.uniform(70, 90)) for _ in range(args.cells)]
+            total = int(args.rate * args.duration)
+            posts = []
+            begin = time.perf_counter()
+            for i in range(total):
+                target = begin + i / args.rate
+                delay = target - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                chat_id = 10_000 + i % args.chats
+                lat, lon = random.choice(cells)
+                update = location_update(i + 1, chat_id, lat + random.uniform(-0.04, 0.04), lon)
+                sent[chat_id].append(time.perf_counter())
+                if mode == "webhook":
+                    # Round-robin, like a load balancer in front of the replicas
+                    bot_port = bot_ports[i % len(bot_ports)]
+                    posts.append(asyncio.create_task(
+                        client.post(f"http://127.0.0.1:{bot_port}/{BENCH_TOKEN}", json=update,
+                                    headers={SECRET_HEADER: BENCH_SECRET})))
+                else:
+                    telegram.push(update)
+            await asyncio.gather(*posts, return_exceptions=True)
+
+            # Wait for the stragglers
+            deadline = time.perf_counter() + args.grace
+            while time.perf_counter() < deadline and \
+                    sum(len(v) for v in telegram.replies.values()) + \
+                    sum(len(v) for v in telegram.errors.values()) < total:
+                await asyncio.sleep(0.05)
+            finished = time.perf_counter()
+    finally:
+        for bot in bots:
+            bot.terminate()
+        for bot in bots:
+            try:
+                bot.wait(15)
+            except subprocess.TimeoutExpired:
+                bot.kill()
+        log.close()
+        if state is not None:
+            await state.stop()
+        server.should_exit = True
+        await server_task
+
+    last_reply = begin
+    for chat_id, times in sent.items():
+        replies = telegram.replies[chat_id]
+        for t in times:
+            if replies:
+                reply = replies.popleft()
+                latencies.append(reply - t)
+                last_reply = max(last_reply, reply)
+            else:
+                failed += 1
+
+    answered = len(latencies)
+    elapsed = max(last_reply, begin + 1e-9) - begin
+    return {
+        "mode": mode,
+        "params": {name: getattr(args, name) for name in RUN_PARAMS},
+        "updates": total,
+        "answered": answered,
+        "failed": failed,
+        "rate_target": args.rate,
+        "updates_per_second": round(answered / elapsed, 1) if answered else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+        "upstream_calls": weather.calls,
+        "upstream_calls_per_update": round(weather.calls / total, 4) if total else 0.0,
+        "points_per_upstream_call": round(weather.points / max(1, weather.calls - weather.failures), 1),
+        "upstream_failures": weather.failures,
+        "error_replies": sum(len(v) for v in telegram.errors.values()),
+        "wall_seconds": round(finished - begin, 2),
+    }
+
+
+async def wait_ready(mode, client, bot, bot_port, telegram, started, timeout=60):
+    while time.perf_counter() - started < timeout:
+        if bot.poll() is not None:
+            raise RuntimeError(f"{' '.join(ENTRY_POINTS[mode])} exited with code {bot.returncode}")
+        if mode == "webhook":
+            try:
+                if (await client.get(f"http://127.0.0.1:{bot_port}/")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+        elif telegram.polls:
+            return
+        await asyncio.sleep(0.05)
+    raise RuntimeError(f"{' '.join(ENTRY_POINTS[mode])} did not become ready in {timeout}s")
+
+
+# ============ REPORTING ============
+COMPARED = ("updates_per_second", "p50_ms", "p95_ms", "p99_ms", "upstream_calls_per_update")
+RUN_PARAMS = ("rate", "duration", "chats", "cells", "om_latency", "om_failure", "real_send_limits", "replicas")
+
+
+def report(result, baseline=None):
+    print(f"\n📊 {result['mode'].upper()}: {result['answered']}/{result['updates']} answered, "
+          f"{result['failed']} failed")
+    if baseline and baseline.get("params") != result["params"]:
+        print(f"   ⚠️ baseline was run with different settings: {baseline.get('params')}")
+    for key, value in result.items():
+        if key in ("mode", "params"):
+            continue
+        line = f"   {key:28} {value}"
+        before = (baseline or {}).get(key)
+        if key in COMPARED and isinstance(value, (int, float)) and before:
+            line += f"   (baseline {before}, {100 * (value - before) / before:+.1f}%)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hermetic Meghdoot load test against fake Telegram and Open-Meteo")
+    parser.add_argument("--mode", choices=["webhook", "polling", "both"], default="both")
+    parser.add_argument("--rate", type=float, default=100, help="updates per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of traffic")
+    parser.add_argument("--chats", type=int, default=5000, help="distinct chats sending updates")
+    parser.add_argument("--cells", type=int, default=300, help="distinct forecast cells")
+    parser.add_argument("--om-latency", type=float, default=0.05, help="fake Open-Meteo latency, seconds")
+    parser.add_argument("--om-failure", type=float, default=0.0, help="fake Open-Meteo failure rate, 0-1")
+    parser.add_argument("--grace", type=float, default=15, help="seconds to wait for late replies")
+    parser.add_argument("--real-send-limits", action="store_true", help="keep Telegram's outbound rate limits")
+    parser.add_argument("--replicas", type=int, default=1,
+                        help="webhook processes sharing state through a local Redis stand-in")
+    parser.add_argument("--baseline", default=BENCH_BASELINE, help="baseline JSON to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--workdir", default=os.path.join(REPO_DIR, ".bench"))
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    if args.replicas > 1 and args.mode != "webhook":
+        parser.error("--replicas needs --mode webhook: Telegram allows one getUpdates poller per bot")
+
+    random.seed(args.seed)
+    os.makedirs(args.workdir, exist_ok=True)
+    # Same build step as a deploy, so the bots only map the place index
+    subprocess.run([sys.executable, "main.py", "build-index"], cwd=REPO_DIR, check=True)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    modes = ["webhook", "polling"] if args.mode == "both" else [args.mode]
+    results = {}
+    for mode in modes:
+        print(f"🚀 {mode}: {args.rate:g} updates/s for {args.duration:g}s "
+              f"({args.chats} chats, {args.cells} cells, Open-Meteo {args.om_latency * 1000:.0f} ms)")
+        results[mode] = asyncio.run(run(mode, args))
+        report(results[mode], baseline.get(mode))
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"\n💾 Baseline saved to {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import os
+import io
+import asyncio
+import importlib.util
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from send_queue import INTERACTIVE
+
+# ============ CONFIGURATION ============
+load_dotenv()
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", 2))
+CHART_CACHE_SIZE = int(os.getenv("CHART_CACHE_SIZE", 2000))
+# Attach the chart to every location reply, not just /chart
+LOCATION_CHARTS = os.getenv("LOCATION_CHARTS", "0") == "1"
+CHART_HOURS = 72
+
+# matplotlib is optional and only ever imported inside the worker processes
+CHARTS_AVAILABLE = importlib.util.find_spec("matplotlib") is not None
+
+
+# ============ RENDERING (worker process) ============
+def render_chart(start, utc_offset_seconds, temps, rain):
+    """PNG bytes of the hourly temperature curve with rain bars"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+
+    times = [datetime.fromtimestamp(start + h * 3600 + utc_offset_seconds, timezone.utc).replace(tzinfo=None)
+             for h in range(len(temps))]
+    fig, ax = plt.subplots(figsize=(8, 4), dpi=100)
+    try:
+        if rain:
+            bars = ax.twinx()
+            bars.bar(times[:len(rain)], rain, width=1 / 24, color="#4a90d9", alpha=0.4)
+            bars.set_ylabel("Rain (mm)")
+            bars.set_ylim(0, max([5.0] + [v * 1.5 for v in rain if v == v]))   # v == v skips NaN
+        ax.plot(times, temps, color="#d9534f", linewidth=2)
+        ax.set_zorder(1)
+        ax.patch.set_visible(False)
+        ax.set_ylabel("Temperature (°C)")
+        ax.set_title("Meghdoot 3-day forecast")
+        ax.grid(alpha=0.3)
+        ax.xaxis.set_major_locator(mdates.DayLocator())
+        ax.xaxis.set_major_formatter(mdates.DateFormatter("%a %d %b"))
+        ax.xaxis.set_minor_locator(mdates.HourLocator(byhour=[6, 12, 18]))
+        fig.tight_layout()
+        out = io.BytesIO()
+        fig.savefig(out, format="png")
+        return out.getvalue()
+    finally:
+        plt.close(fig)
+
+
+# ============ CHART CACHE ============
+class ChartRenderer:
+    """Renders forecast charts off the event loop, once per (grid cell, run), then reuses the Telegram file_id"""
+
+    def __init__(self, workers=CHART_WORKERS, max_size=CHART_CACHE_SIZE):
+        self.workers = workers
+        self.max_size = max_size
+        self._pool = None
+        self._charts = OrderedDict()   # (cell, run) -> PNG bytes, then file_id once uploaded
+        self._inflight = {}            # (cell, run) -> asyncio.Future of PNG bytes
+        self._uploads = {}             # (cell, run) -> asyncio.Future of the file_id
+        self.rendered = 0
+        self.uploads = 0
+        self.reused = 0
+
+    def start(self):
+        """Create the worker pool at startup rather than inside the first /chart"""
+        if CHARTS_AVAILABLE:
+            self._executor()
+
+    def _executor(self):
+        if self._pool is None:
+            # Forking a process that already runs to_thread workers can copy a held lock and
+            # deadlock the child, so workers start from a clean forkserver (spawn on Windows)
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context(method))
+        return self._pool
+
+    @staticmethod
+    def key(data):
+        if data.grid_cell is None or data.forecast_run is None:
+            return None
+        return (data.grid_cell, data.forecast_run)
+
+    async def _render(self, data):
+        hours = min(CHART_HOURS, data.hours)
+        temps = data.series('temperature_2m')[:hours]
+        rain = data.series('precipitation')
+        rain = rain[:hours] if rain else None
+        loop = asyncio.get_running_loop()
+        png = await loop.run_in_executor(self._executor(), render_chart,
+                                         data.start, data.utc_offset_seconds, temps, rain)
+        self.rendered += 1
+        return png
+
+    async def photo(self, data):
+        """Cached file_id if this chart was uploaded before, else PNG bytes"""
+        key = self.key(data)
+        if key is None:
+            return await self._render(data)
+        photo = self._charts.get(key)
+        if photo is not None:
+            self._charts.move_to_end(key)
+            return photo
+        future = self._inflight.get(key)
+        if future is None:
+            future = self._inflight[key] = asyncio.ensure_future(self._render(data))
+            future.add_done_callback(lambda f: self._inflight.pop(key, None))
+            png = await asyncio.shield(future)
+            self._remember(key, png)
+            return png
+        return await asyncio.shield(future)
+
+    def _remember(self, key, photo):
+        if key is None:
+            return
+        # Never downgrade a file_id back to raw bytes
+        if isinstance(self._charts.get(key), str):
+            return
+        self._charts[key] = photo
+        self._charts.move_to_end(key)
+        while len(self._charts) > self.max_size:
+            self._charts.popitem(last=False)
+
+    async def send(self, sender, chat_id, data, caption=None, priority=INTERACTIVE):
+        """Send the chart for a forecast; only the first send of a (cell, run) uploads bytes"""
+        key = self.key(data)
+        photo = await self.photo(data)
+        if isinstance(photo, bytes) and key is not None:
+            if key in self._uploads:
+                # Someone is uploading this chart right now; wait for its file_id
+                await asyncio.shield(self._uploads[key])
+            cached = self._charts.get(key)
+            if isinstance(cached, str):
+                photo = cached
+        if isinstance(photo, str):
+            self.reused += 1
+            return await sender.submit(chat_id, "send_photo", priority, photo=photo, caption=caption)
+
+        upload = None
+        if key is not None and key not in self._uploads:
+            upload = self._uploads[key] = asyncio.get_running_loop().create_future()
+        file_id = None
+        try:
+            message = await sender.submit(chat_id, "send_photo", priority, photo=photo, caption=caption)
+            self.uploads += 1
+            if message is not None and message.photo:
+                file_id = message.photo[-1].file_id
+                self._remember(key, file_id)
+            return message
+        finally:
+            if upload is not None:
+                del self._uploads[key]
+                upload.set_result(file_id)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def stats(self):
+        return {
+            "entries": len(self._charts),
+            "rendered": self.rendered,
+            "uploads": self.uploads,
+            "file_id_reuses": self.reused
+        }
+
+
+charts = ChartRenderer()
@@ -0,0 +1,164 @@
+import os
+import time
+import asyncio
+import traceback
+from collections import namedtuple
+import numpy as np
+from dotenv import load_dotenv
+
+# ============ CONFIGURATION ============
+load_dotenv()
+# Snapshot file so last locations survive restarts; empty keeps state in memory only
+CHAT_STATE_PATH = os.getenv("CHAT_STATE_PATH", "chat_state.npz")
+CHAT_STATE_MERGE_SIZE = int(os.getenv("CHAT_STATE_MERGE_SIZE", 4096))
+CHAT_STATE_SAVE_SECONDS = float(os.getenv("CHAT_STATE_SAVE_SECONDS", 300))
+
+LANGUAGES = ("en", "hi")
+PREF_CHARTS = 1          # attach a chart to forecast replies
+PREF_ALERTS = 2          # heat/frost alerts wanted
+
+ChatState = namedtuple("ChatState", "lat lon lang prefs seen")
+_COLUMNS = ChatState._fields
+
+
+# ============ CHAT STATE STORE ============
+class ChatStateStore:
+    """Last location, language and preferences per chat in parallel numpy arrays (~22 bytes per chat)"""
+
+    def __init__(self, path=CHAT_STATE_PATH, merge_size=CHAT_STATE_MERGE_SIZE):
+        self.path = path
+        self.merge_size = merge_size
+        # Sorted by chat id and searched with searchsorted; no per-chat Python objects
+        self._ids = np.empty(0, dtype=np.int64)
+        self._lat = np.empty(0, dtype=np.float32)
+        self._lon = np.empty(0, dtype=np.float32)
+        self._lang = np.empty(0, dtype=np.uint8)
+        self._prefs = np.empty(0, dtype=np.uint8)
+        self._seen = np.empty(0, dtype=np.uint32)
+        # New chats wait here until a batch is merged into the arrays
+        self._staged = {}    # chat_id -> [lat, lon, lang, prefs, seen]
+        self._dirty = False
+        self._task = None
+
+    def __len__(self):
+        return len(self._ids) + len(self._staged)
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self._ids, self._lat, self._lon, self._lang, self._prefs, self._seen))
+
+    def _index(self, chat_id):
+        i = int(self._ids.searchsorted(chat_id))
+        if i < len(self._ids) and self._ids[i] == chat_id:
+            return i
+        return None
+
+    def get(self, chat_id):
+        """ChatState for a chat (lat/lon are None until a location was shared), or None"""
+        staged = self._staged.get(chat_id)
+        if staged is not None:
+            lat, lon, lang, prefs, seen = staged
+        else:
+            i = self._index(chat_id)
+            if i is None:
+                return None
+            lat, lon = float(self._lat[i]), float(self._lon[i])
+            lang, prefs, seen = int(self._lang[i]), int(self._prefs[i]), int(self._seen[i])
+        if lat != lat:   # NaN: no location yet
+            lat = lon = None
+        return ChatState(lat, lon, LANGUAGES[lang], prefs, seen)
+
+    def _update(self, chat_id, **fields):
+        fields["seen"] = int(time.time())
+        self._dirty = True
+        staged = self._staged.get(chat_id)
+        if staged is None:
+            i = self._index(chat_id)
+            if i is not None:
+                for name, value in fields.items():
+                    getattr(self, "_" + name)[i] = value
+                return
+            staged = self._staged[chat_id] = [float("nan"), float("nan"), 0, 0, 0]
+        for name, value in fields.items():
+            staged[_COLUMNS.index(name)] = value
+        # Batches grow with the table so merging stays amortised O(1) per chat
+        if len(self._staged) >= max(self.merge_size, len(self._ids) // 16):
+            self._merge()
+
+    def set_location(self, chat_id, lat, lon):
+        self._update(chat_id, lat=lat, lon=lon)
+
+    def set_language(self, chat_id, lang):
+        self._update(chat_id, lang=LANGUAGES.index(lang) if lang in LANGUAGES else 0)
+
+    def set_prefs(self, chat_id, prefs):
+        self._update(chat_id, prefs=prefs)
+
+    def _merge(self):
+        """Fold staged chats into the sorted arrays"""
+        if not self._staged:
+            return
+        ids = np.fromiter(self._staged, dtype=np.int64, count=len(self._staged))
+        rows = list(self._staged.values())
+        order = np.argsort(ids)
+        at = np.searchsorted(self._ids, ids[order])
+        self._ids = np.insert(self._ids, at, ids[order])
+        for column, name in enumerate(_COLUMNS):
+            current = getattr(self, "_" + name)
+            added = np.array([row[column] for row in rows], dtype=current.dtype)[order]
+            setattr(self, "_" + name, np.insert(current, at, added))
+        self._staged.clear()
+
+    # ---- persistence ----
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        with np.load(self.path) as data:
+            self._ids = data["ids"]
+            self._lat, self._lon = data["lat"], data["lon"]
+            self._lang, self._prefs, self._seen = data["lang"], data["prefs"], data["seen"]
+        print(f"💾 {len(self._ids)} chat states loaded")
+
+    def _write(self, arrays):
+        tmp_path = self.path + ".tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, self.path)
+
+    async def save(self):
+        """Write a snapshot if anything changed since the last one"""
+        if not self.path or not self._dirty:
+            return
+        self._merge()
+        self._dirty = False
+        # Copied on the loop: handlers keep updating the live arrays while the thread writes
+        arrays = {name: getattr(self, "_" + name).copy() for name in ("ids",) + _COLUMNS}
+        try:
+            await asyncio.to_thread(self._write, arrays)
+        except BaseException:
+            self._dirty = True
+            raise
+
+    def start(self):
+        if self.path:
+            self._task = asyncio.create_task(self._autosave())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.save()
+
+    async def _autosave(self):
+        while True:
+            await asyncio.sleep(CHAT_STATE_SAVE_SECONDS)
+            try:
+                await self.save()
+            except Exception:
+                traceback.print_exc()
+
+    def stats(self):
+        return {"chats": len(self), "staged": len(self._staged), "bytes": self.nbytes}
+
+
+chat_state = ChatStateStore()
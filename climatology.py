@@ -0,0 +1,209 @@
+import os
+import re
+import sys
+import time
+import struct
+import argparse
+from datetime import date, timedelta
+import numpy as np
+from dotenv import load_dotenv
+
+# ============ CONFIGURATION ============
+load_dotenv()
+# Precomputed normals grid, built by "python main.py build-normals"; the feature is off when it is missing
+NORMALS_DEFAULT_PATH = "normals.bin"
+NORMALS_RECHECK_SECONDS = float(os.getenv("NORMALS_RECHECK_SECONDS", 60))   # look for a new or rebuilt file
+CLIMATE_ANOMALY_MIN = float(os.getenv("CLIMATE_ANOMALY_MIN", 2))   # °C, smaller is "near normal"
+
+_MAGIC = b"MGN1"
+_HEADER = struct.Struct("<4sdddiii")   # magic, south lat, west lon, step, rows, cols, periods
+TMIN, TMAX = range(2)
+PERIODS = 36                           # early/mid/late of each month
+
+MONTHS = ("January", "February", "March", "April", "May", "June", "July",
+          "August", "September", "October", "November", "December")
+THIRDS = ("early", "mid", "late")
+
+
+def period_of(date):
+    """Ten-day period (0-35) of a date"""
+    return (date.month - 1) * 3 + min(2, (date.day - 1) // 10)
+
+
+def normals_path():
+    """$NORMALS_PATH as it is now, so the file can be installed or moved without a restart"""
+    return os.getenv("NORMALS_PATH", NORMALS_DEFAULT_PATH)
+
+
+def period_label(period):
+    return f"{THIRDS[period % 3]}-{MONTHS[period // 3]}"
+
+
+# ============ NORMALS FILE ============
+def write_normals(path, south, west, step, normals):
+    """Save a float32 (rows, cols, 36, 2) array of daily min/max normals, NaN where unknown"""
+    normals = np.ascontiguousarray(normals, dtype=np.float32)
+    rows, cols, periods, channels = normals.shape
+    if periods != PERIODS or channels != 2:
+        raise ValueError("normals must have shape (rows, cols, 36, 2)")
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, south, west, step, rows, cols, periods))
+        f.write(normals.tobytes())
+
+
+class Normals:
+    """Long-term normals per grid point and ten-day period, memory-mapped so only touched pages load"""
+
+    def __init__(self, path=None):
+        path = path or normals_path()
+        with open(path, "rb") as f:
+            header = f.read(_HEADER.size)
+        magic, self.south, self.west, self.step, rows, cols, periods = _HEADER.unpack(header)
+        if magic != _MAGIC or periods != PERIODS:
+            raise ValueError(f"{path} is not a normals grid")
+        # One location's whole year is contiguous: a lookup touches a single page
+        self._grid = np.memmap(path, dtype=np.float32, mode="r", offset=_HEADER.size,
+                               shape=(rows, cols, periods, 2))
+
+    def at(self, lat, lon):
+        """(36, 2) view of min/max normals for the nearest grid point, or None outside the grid"""
+        row = round((lat - self.south) / self.step)
+        col = round((lon - self.west) / self.step)
+        if not (0 <= row < self._grid.shape[0] and 0 <= col < self._grid.shape[1]):
+            return None
+        return self._grid[row, col]
+
+    def anomalies(self, forecast, daily):
+        """Per forecast day: (day index, °C the high beat its normal, °C the low beat its normal,
+        period label), NaN where the normal is unknown; None outside the grid"""
+        normals = self.at(forecast.latitude, forecast.longitude)
+        if normals is None:
+            return None
+        days = []
+        for day in range(len(daily['temp_max'])):
+            period = period_of(forecast.time(day * 24))
+            days.append((day, float(daily['temp_max'][day] - normals[period, TMAX]),
+                         float(daily['temp_min'][day] - normals[period, TMIN]), period_label(period)))
+        return days
+
+
+_normals = None
+_normals_source = None       # (path, mtime) _normals was opened from, or tried and failed
+_normals_checked = float("-inf")
+
+
+def get_normals():
+    """Shared Normals grid, or None while no dataset is installed; picks up a new file within a minute"""
+    global _normals, _normals_source, _normals_checked
+    now = time.monotonic()
+    if now - _normals_checked < NORMALS_RECHECK_SECONDS:
+        return _normals
+    _normals_checked = now
+    path = normals_path()
+    try:
+        source = (path, os.path.getmtime(path))
+    except OSError:
+        _normals = _normals_source = None
+        return None
+    if source != _normals_source:
+        _normals_source = source
+        try:
+            _normals = Normals(path)
+        except (OSError, ValueError, struct.error) as e:
+            _normals = None
+            print(f"⚠️ Climatology disabled: {e}")
+    return _normals
+
+
+# ============ ADVICE ============
+def climate_advice(forecast, daily):
+    """Advice lines for the forecast days whose high or low stands out from that day's normal, or None"""
+    normals = get_normals()
+    days = normals.anomalies(forecast, daily) if normals else None
+    if not days:
+        return None
+    known = [(day, high, low, label) for day, high, low, label in days if high == high or low == low]
+    if not known:
+        return None
+    lines = []
+    for day, high, low, label in known:
+        name = forecast.time(day * 24).strftime('%a')
+        # The larger departure of the day's high and low; NaN compares False and drops out
+        if abs(low) > abs(high) or high != high:
+            kind, anomaly = "nights", low
+        else:
+            kind, anomaly = "highs", high
+        if anomaly >= CLIMATE_ANOMALY_MIN:
+            lines.append(f"• 🌡️ {name}: {kind} {anomaly:.0f}°C above normal for {label}\n")
+        elif anomaly <= -CLIMATE_ANOMALY_MIN:
+            lines.append(f"• 🌡️ {name}: {kind} {-anomaly:.0f}°C below normal for {label}\n")
+    if not lines:
+        return f"• 🌱 Near normal for {known[0][3]}\n"
+    return "".join(lines)
+
+
+# ============ IMD GRIDDED DATA CONVERTER ============
+# IMD's daily 1° gridded max/min temperature (imdpune.gov.in, "Gridded Data"), one file per
+# year such as Maxtemp_MaxT_2020.GRD / Mintemp_MinT_2020.GRD: little-endian float32
+# (days, lat, lon) from 7.5°N/67.5°E, 31 x 31 points, 99.9 where there is no data
+IMD_SOUTH, IMD_WEST, IMD_STEP, IMD_ROWS, IMD_COLS = 7.5, 67.5, 1.0, 31, 31
+IMD_MISSING = 99.9
+
+
+def _year_of(path):
+    match = re.search(r"(19|20)\d\d", os.path.basename(path))
+    if match is None:
+        raise ValueError(f"{path}: no year in the file name")
+    return int(match.group())
+
+
+def _period_sums(paths, rows, cols):
+    """Per-period sums and counts of valid daily values over all the yearly files"""
+    sums = np.zeros((PERIODS, rows, cols))
+    counts = np.zeros((PERIODS, rows, cols))
+    for path in paths:
+        year = _year_of(path)
+        days = np.fromfile(path, dtype="<f4").reshape(-1, rows, cols)
+        first = date(year, 1, 1)
+        periods = np.array([period_of(first + timedelta(day)) for day in range(len(days))])
+        valid = np.abs(days - IMD_MISSING) > 0.01
+        for period in range(PERIODS):
+            selected = periods == period
+            sums[period] += np.where(valid[selected], days[selected], 0).sum(axis=0)
+            counts[period] += valid[selected].sum(axis=0)
+        print(f"📅 {os.path.basename(path)}: {len(days)} days")
+    return sums, counts
+
+
+def convert_imd(tmin_paths, tmax_paths, path=None, south=IMD_SOUTH, west=IMD_WEST,
+                step=IMD_STEP, rows=IMD_ROWS, cols=IMD_COLS):
+    """Average yearly IMD min/max temperature grids into a normals file (ideally 30 years)"""
+    path = path or normals_path()
+    normals = np.full((rows, cols, PERIODS, 2), np.nan, dtype=np.float32)
+    for channel, paths in ((TMIN, tmin_paths), (TMAX, tmax_paths)):
+        sums, counts = _period_sums(paths, rows, cols)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            normals[..., channel] = np.moveaxis(sums / counts, 0, -1)
+    write_normals(path, south, west, step, normals)
+    covered = int(np.isfinite(normals[..., TMAX]).all(axis=-1).sum())
+    print(f"🌡️ Normals written to {path}: {rows} x {cols} grid, {covered} points with a full year")
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="build-normals",
+                                     description="Build the normals file from IMD gridded temperature data")
+    parser.add_argument("--tmin", nargs="+", required=True, help="yearly Mintemp_MinT_YYYY.GRD files")
+    parser.add_argument("--tmax", nargs="+", required=True, help="yearly Maxtemp_MaxT_YYYY.GRD files")
+    parser.add_argument("--out", default=normals_path(), help="output file (default: $NORMALS_PATH)")
+    args = parser.parse_args(argv)
+    try:
+        convert_imd(args.tmin, args.tmax, args.out)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+import os
+import asyncio
+from dotenv import load_dotenv
+
+# ============ CONFIGURATION ============
+load_dotenv()
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", 15))
+BATCH_MAX_POINTS = int(os.getenv("BATCH_MAX_POINTS", 50))
+
+
+# ============ MICRO-BATCHER ============
+class ForecastBatcher:
+    """Collects single-point forecast requests into multi-location upstream calls"""
+
+    def __init__(self, fetch_many, window_ms=BATCH_WINDOW_MS, max_points=BATCH_MAX_POINTS):
+        self.fetch_many = fetch_many
+        self.window = window_ms / 1000
+        self.max_points = max_points
+        self._pending = {}   # (lat, lon) -> [futures]
+        self._timer = None
+        self._tasks = set()
+        self.batches = 0
+        self.points = 0
+
+    async def fetch(self, lat, lon):
+        """Forecast for one point, sent upstream together with its neighbours in time"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault((lat, lon), []).append(future)
+        if len(self._pending) >= self.max_points:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        task = asyncio.ensure_future(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch):
+        points = list(batch)
+        self.batches += 1
+        self.points += len(points)
+        try:
+            results = await self.fetch_many(points)
+        except Exception as e:
+            for futures in batch.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        for point, result in zip(points, results):
+            for future in batch[point]:
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "points": self.points,
+            "avg_batch_size": round(self.points / self.batches, 2) if self.batches else 0.0,
+            "pending": len(self._pending)
+        }
@@ -0,0 +1,288 @@
+import os
+import time
+import struct
+import asyncio
+from collections import OrderedDict
+from dotenv import load_dotenv
+from forecast_record import Forecast
+from state_backend import StateBackendError
+
+# ============ CONFIGURATION ============
+load_dotenv()
+# Grid step in degrees, roughly the forecast model resolution (0.1° ≈ 11 km)
+FORECAST_GRID = float(os.getenv("FORECAST_GRID", 0.1))
+# New model runs land every few hours, shortly after the run time
+FORECAST_RUN_HOURS = float(os.getenv("FORECAST_RUN_HOURS", 3))
+FORECAST_RUN_DELAY_MINUTES = float(os.getenv("FORECAST_RUN_DELAY_MINUTES", 0))
+FORECAST_CACHE_SIZE = int(os.getenv("FORECAST_CACHE_SIZE", 10000))
+# After expiry a forecast is still served for this long while it refreshes in the background
+FORECAST_STALE_MINUTES = float(os.getenv("FORECAST_STALE_MINUTES", 60))
+# With a shared state backend, one replica holds a cell's fetch lock for at most the loader's
+# timeout (weather_service passes it in; this is the fallback), while the others poll for the
+# result, backing off from the first to the longest interval
+FORECAST_FETCH_LOCK_SECONDS = 15
+FORECAST_FETCH_POLL_SECONDS = float(os.getenv("FORECAST_FETCH_POLL_SECONDS", 0.05))
+FORECAST_FETCH_POLL_MAX_SECONDS = float(os.getenv("FORECAST_FETCH_POLL_MAX_SECONDS", 1))
+
+_SHARED_HEADER = struct.Struct("<d")   # expires_at, then Forecast.to_bytes()
+
+
+# ============ GRID HELPERS ============
+def grid_cell(lat, lon, grid=FORECAST_GRID):
+    """Snap coordinates to a forecast grid cell"""
+    return (round(lat / grid), round(lon / grid))
+
+
+def cell_center(cell, grid=FORECAST_GRID):
+    """Coordinates of a grid cell's center"""
+    return (round(cell[0] * grid, 4), round(cell[1] * grid, 4))
+
+
+def next_run_at(now=None, run_hours=FORECAST_RUN_HOURS, delay_minutes=FORECAST_RUN_DELAY_MINUTES):
+    """Epoch time at which the next forecast run becomes available"""
+    now = time.time() if now is None else now
+    period = run_hours * 3600
+    delay = delay_minutes * 60
+    return ((now - delay) // period + 1) * period + delay
+
+
+# ============ CACHE ============
+class ForecastCache:
+    """LRU forecast cache per grid cell with single-flight upstream fetches, across replicas if shared"""
+
+    def __init__(self, loader, grid=FORECAST_GRID, max_size=FORECAST_CACHE_SIZE,
+                 run_hours=FORECAST_RUN_HOURS, run_delay_minutes=FORECAST_RUN_DELAY_MINUTES, store=None,
+                 stale_minutes=FORECAST_STALE_MINUTES, shared=None, lock_seconds=FORECAST_FETCH_LOCK_SECONDS):
+        self.loader = loader
+        self.store = store
+        self.shared = shared
+        self.lock_seconds = lock_seconds
+        # Identifies this replica's fetch locks so it never releases another replica's
+        self._lock_token = os.urandom(8).hex().encode()
+        self.stale_seconds = stale_minutes * 60
+        self.grid = grid
+        self.max_size = max_size
+        self.run_hours = run_hours
+        self.run_delay_minutes = run_delay_minutes
+        self._entries = OrderedDict()  # cell -> (expires_at, data)
+        self._inflight = {}            # cell -> asyncio.Task
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.load_failures = 0
+        self.evictions = 0
+        self.upstream_calls = 0
+        self.upstream_seconds = 0.0
+        self.shared_hits = 0
+        self.shared_errors = 0
+
+    def cell(self, lat, lon):
+        return grid_cell(lat, lon, self.grid)
+
+    def peek(self, cell, allow_stale=False):
+        """Return a still-valid (or, if allowed, stale but usable) cached forecast, or None"""
+        entry = self._entries.get(cell)
+        if entry is None:
+            return None
+        expires_at, data = entry
+        now = time.time()
+        if expires_at <= now:
+            if expires_at + self.stale_seconds <= now:
+                del self._entries[cell]
+                return None
+            if not allow_stale:
+                return None
+        self._entries.move_to_end(cell)
+        return data
+
+    def is_fresh(self, cell):
+        entry = self._entries.get(cell)
+        return entry is not None and entry[0] > time.time()
+
+    def put(self, cell, data, expires_at=None):
+        if expires_at is None:
+            expires_at = next_run_at(run_hours=self.run_hours, delay_minutes=self.run_delay_minutes)
+        # Tag the forecast so downstream caches can key on (cell, run)
+        data.grid_cell = cell
+        data.forecast_run = int(expires_at - self.run_hours * 3600)
+        self._entries[cell] = (expires_at, data)
+        self._entries.move_to_end(cell)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return expires_at
+
+    async def get(self, lat, lon):
+        """Cached forecast for the cell containing (lat, lon)"""
+        cell = self.cell(lat, lon)
+        data = self.peek(cell, allow_stale=True)
+        if data is not None:
+            if self.is_fresh(cell):
+                self.hits += 1
+            else:
+                # Stale-while-revalidate: answer now, refresh behind the farmer's back
+                self.stale_hits += 1
+                self._start_load(cell)
+            return data
+
+        task = self._inflight.get(cell)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = self._start_load(cell)
+        # Shield so one cancelled handler doesn't abort the fetch for the others
+        return await asyncio.shield(task)
+
+    async def get_fresh(self, lat, lon):
+        """Like get(), but waits for the current run instead of serving a stale forecast"""
+        cell = self.cell(lat, lon)
+        if self.is_fresh(cell):
+            self.hits += 1
+            return self.peek(cell)
+        self.misses += 1
+        return await asyncio.shield(self._start_load(cell))
+
+    async def prefetch(self, cell):
+        """Load a cell's current run ahead of demand; False if it was already fresh"""
+        if self.is_fresh(cell):
+            return False
+        await asyncio.shield(self._start_load(cell))
+        return True
+
+    def _start_load(self, cell):
+        task = self._inflight.get(cell)
+        if task is None:
+            task = asyncio.ensure_future(self._load(cell))
+            task.add_done_callback(self._load_done)
+            self._inflight[cell] = task
+        return task
+
+    def _load_done(self, task):
+        # Mark a failed fetch as retrieved even if every waiter went away
+        if not task.cancelled() and task.exception() is not None:
+            self.load_failures += 1
+
+    async def _load(self, cell):
+        try:
+            # After a restart the on-disk store answers before Open-Meteo does
+            if self.store is not None:
+                stored = await self.store.get(cell)
+                if stored is not None:
+                    expires_at, data = stored
+                    self.put(cell, data, expires_at)
+                    return data
+            if self.shared is None:
+                return await self._fetch_and_store(cell)
+            data, locked = await self._shared_wait(cell)
+            if data is not None:
+                return data
+            try:
+                return await self._fetch_and_store(cell)
+            finally:
+                # Without the lock (deadline, backend error) it may belong to another replica
+                if locked:
+                    await self._shared_call(self.shared.delete_if(self._lock_key(cell), self._lock_token))
+        finally:
+            self._inflight.pop(cell, None)
+
+    async def _fetch_and_store(self, cell):
+        data = await self._fetch(cell)
+        expires_at = self.put(cell, data)
+        if self.store is not None:
+            try:
+                await self.store.put(cell, data, expires_at)
+            except Exception as e:
+                print(f"⚠️ Forecast store write failed: {e}")
+        if self.shared is not None:
+            ttl = expires_at + self.stale_seconds - time.time()
+            await self._shared_call(self.shared.set(
+                self._forecast_key(cell), _SHARED_HEADER.pack(expires_at) + data.to_bytes(), ttl=ttl))
+        return data
+
+    # ---- shared state (multiple replicas) ----
+    @staticmethod
+    def _forecast_key(cell):
+        return f"forecast:{cell[0]}:{cell[1]}"
+
+    @staticmethod
+    def _lock_key(cell):
+        return f"fetch:{cell[0]}:{cell[1]}"
+
+    async def _shared_call(self, command):
+        """Run a backend command; an unreachable backend degrades to per-replica caching"""
+        try:
+            return await command
+        except StateBackendError as e:
+            self.shared_errors += 1
+            print(f"⚠️ Shared state unavailable: {e}")
+            return None
+
+    async def _shared_get(self, cell):
+        payload = await self.shared.get(self._forecast_key(cell))
+        if payload is None:
+            return None
+        (expires_at,) = _SHARED_HEADER.unpack_from(payload)
+        if expires_at <= time.time():
+            return None
+        try:
+            data = Forecast.from_bytes(payload[_SHARED_HEADER.size:])
+        except (ValueError, struct.error):
+            return None  # written by an older version; refetch
+        self.put(cell, data, expires_at)
+        self.shared_hits += 1
+        return data
+
+    async def _shared_wait(self, cell):
+        """(forecast another replica fetched, None) or (None, whether this replica took the fetch lock)"""
+        deadline = time.monotonic() + self.lock_seconds
+        poll = FORECAST_FETCH_POLL_SECONDS
+        try:
+            while True:
+                data = await self._shared_get(cell)
+                if data is not None:
+                    return data, False
+                if await self.shared.set(self._lock_key(cell), self._lock_token,
+                                         ttl=self.lock_seconds, only_new=True):
+                    return None, True
+                if time.monotonic() >= deadline:
+                    return None, False
+                await asyncio.sleep(min(poll, max(0.0, deadline - time.monotonic())))
+                poll = min(poll * 2, FORECAST_FETCH_POLL_MAX_SECONDS)
+        except StateBackendError as e:
+            self.shared_errors += 1
+            print(f"⚠️ Shared state unavailable: {e}")
+            return None, False
+
+    async def _fetch(self, cell):
+        lat, lon = cell_center(cell, self.grid)
+        started = time.perf_counter()
+        self.upstream_calls += 1
+        try:
+            return await self.loader(lat, lon)
+        finally:
+            self.upstream_seconds += time.perf_counter() - started
+
+    def stats(self):
+        lookups = self.hits + self.stale_hits + self.misses + self.coalesced
+        served = self.hits + self.stale_hits + self.coalesced
+        avg_fetch = self.upstream_seconds / self.upstream_calls if self.upstream_calls else 0.0
+        return {
+            "entries": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_ratio": round(served / lookups, 4) if lookups else 0.0,
+            "upstream_calls": self.upstream_calls,
+            "upstream_calls_saved": served,
+            "load_failures": self.load_failures,
+            "shared_hits": self.shared_hits,
+            "shared_errors": self.shared_errors,
+            "avg_fetch_seconds": round(avg_fetch, 4),
+            "latency_saved_seconds": round((self.hits + self.stale_hits) * avg_fetch, 2)
+        }
+
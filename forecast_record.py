@@ -0,0 +1,111 @@
+import math
+import struct
+from array import array
+from datetime import datetime, timezone
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # orjson is optional; the stdlib parser is just slower
+    import json
+    _loads = json.loads
+
+_MAGIC = b"MGF1"
+_HEADER = struct.Struct("<4sddiqIH")   # magic, lat, lon, utc offset, start, hours, variables
+_NAME = struct.Struct("<B")
+
+
+# ============ COMPACT FORECAST ============
+class Forecast:
+    """Hourly forecast for one point: float32 arrays per variable on a fixed hourly time axis"""
+
+    __slots__ = ("latitude", "longitude", "utc_offset_seconds", "start", "hours",
+                 "variables", "grid_cell", "forecast_run")
+
+    def __init__(self, latitude, longitude, utc_offset_seconds, start, hours, variables):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.utc_offset_seconds = utc_offset_seconds
+        self.start = start                # epoch seconds (UTC) of the first hour
+        self.hours = hours
+        self.variables = variables        # name -> array('f')
+        self.grid_cell = None
+        self.forecast_run = None
+
+    def series(self, name):
+        return self.variables.get(name)
+
+    def time(self, index):
+        """Local wall-clock time of an hour index"""
+        local = self.start + index * 3600 + self.utc_offset_seconds
+        return datetime.fromtimestamp(local, timezone.utc).replace(tzinfo=None)
+
+    @property
+    def nbytes(self):
+        return sum(values.itemsize * len(values) for values in self.variables.values())
+
+    def __repr__(self):
+        return (f"Forecast({self.latitude:.2f}, {self.longitude:.2f}, {self.hours}h, "
+                f"{', '.join(self.variables)})")
+
+    # ---- binary form for the on-disk store ----
+    def to_bytes(self):
+        parts = [_HEADER.pack(_MAGIC, self.latitude, self.longitude, self.utc_offset_seconds,
+                              self.start, self.hours, len(self.variables))]
+        for name, values in self.variables.items():
+            encoded = name.encode()
+            parts.append(_NAME.pack(len(encoded)))
+            parts.append(encoded)
+            parts.append(values.tobytes())
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, payload):
+        magic, lat, lon, offset, start, hours, count = _HEADER.unpack_from(payload)
+        if magic != _MAGIC:
+            raise ValueError("Not a stored forecast")
+        pos = _HEADER.size
+        variables = {}
+        for _ in range(count):
+            (length,) = _NAME.unpack_from(payload, pos)
+            pos += _NAME.size
+            name = payload[pos:pos + length].decode()
+            pos += length
+            values = array("f")
+            values.frombytes(payload[pos:pos + hours * values.itemsize])
+            pos += hours * values.itemsize
+            variables[name] = values
+        return cls(lat, lon, offset, start, hours, variables)
+
+
+# ============ DECODING ============
+def _float_array(values):
+    try:
+        return array("f", values)
+    except TypeError:
+        # Open-Meteo sends null for missing hours
+        return array("f", [math.nan if v is None else v for v in values])
+
+
+def decode_forecast(item, variables):
+    """Keep only the requested hourly fields of one Open-Meteo location"""
+    hourly = item["hourly"]
+    times = hourly["time"]
+    return Forecast(
+        latitude=item["latitude"],
+        longitude=item["longitude"],
+        utc_offset_seconds=item.get("utc_offset_seconds", 0),
+        start=times[0] if times else 0,
+        hours=len(times),
+        variables={name: _float_array(hourly[name]) for name in variables if name in hourly}
+    )
+
+
+def decode_forecasts(payload, variables):
+    """Open-Meteo response body (one location or a list) -> list of Forecast"""
+    data = _loads(payload)
+    if isinstance(data, dict):
+        if data.get("error"):
+            raise ValueError(data.get("reason", "Open-Meteo error"))
+        data = [data]
+    return [decode_forecast(item, variables) for item in data]
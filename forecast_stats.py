@@ -0,0 +1,59 @@
+import warnings
+import numpy as np
+from weather_client import HOURLY_VARIABLES
+
+# ============ AGRONOMIC CONSTANTS ============
+GDD_BASE_TEMP = 10.0        # °C, base temperature for growing degree days
+HEAT_STRESS_TEMP = 35.0     # °C, hours above this count as heat stress
+
+TEMP, RAIN, HUMIDITY, WIND, ET0 = range(len(HOURLY_VARIABLES))
+
+
+# ============ AGGREGATION ============
+def hourly_block(forecast, days, out=None):
+    """Forecast -> float32 array of shape (variables, days, 24), NaN where missing"""
+    if out is None:
+        out = np.empty((len(HOURLY_VARIABLES), days * 24), dtype=np.float32)
+    out.fill(np.nan)
+    for i, name in enumerate(HOURLY_VARIABLES):
+        values = forecast.series(name)
+        if values:
+            # array('f') is already float32, so this is a zero-copy view
+            values = np.frombuffer(values, dtype=np.float32)[:days * 24]
+            out[i, :len(values)] = values
+    return out.reshape(len(HOURLY_VARIABLES), days, 24)
+
+
+def aggregate_many(forecasts, days=3):
+    """Daily stats for many locations in one vectorized pass; each value has shape (locations, days)"""
+    block = np.empty((len(forecasts), len(HOURLY_VARIABLES), days * 24), dtype=np.float32)
+    for i, forecast in enumerate(forecasts):
+        hourly_block(forecast, days, out=block[i])
+    return aggregate_block(block.reshape(len(forecasts), len(HOURLY_VARIABLES), days, 24))
+
+
+def aggregate_block(block):
+    """Daily stats from a (locations, variables, days, 24) array"""
+    temp = block[:, TEMP]
+    with warnings.catch_warnings():
+        # Days without data come out as NaN instead of raising
+        warnings.simplefilter("ignore", RuntimeWarning)
+        temp_min = np.nanmin(temp, axis=-1)
+        temp_max = np.nanmax(temp, axis=-1)
+        stats = {
+            "temp_min": temp_min,
+            "temp_max": temp_max,
+            "temp_mean": np.nanmean(temp, axis=-1),
+            "rain_total": np.nansum(block[:, RAIN], axis=-1),
+            "humidity_mean": np.nanmean(block[:, HUMIDITY], axis=-1),
+            "wind_max": np.nanmax(block[:, WIND], axis=-1),
+            "et0_total": np.nansum(block[:, ET0], axis=-1),
+        }
+    stats["gdd"] = np.clip((temp_min + temp_max) / 2 - GDD_BASE_TEMP, 0, None)
+    stats["heat_stress_hours"] = (temp > HEAT_STRESS_TEMP).sum(axis=-1)
+    return stats
+
+
+def aggregate(forecast, days=3):
+    """Daily stats for one location; each value has shape (days,)"""
+    return {name: values[0] for name, values in aggregate_many([forecast], days).items()}
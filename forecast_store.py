@@ -0,0 +1,90 @@
+import os
+import time
+import struct
+import sqlite3
+import asyncio
+import threading
+from dotenv import load_dotenv
+from forecast_record import Forecast
+
+# ============ CONFIGURATION ============
+load_dotenv()
+# Put this on a Railway volume so forecasts survive redeploys; empty disables the store
+FORECAST_STORE = os.getenv("FORECAST_STORE", "forecasts.db")
+FORECAST_STORE_PRUNE_SECONDS = float(os.getenv("FORECAST_STORE_PRUNE_SECONDS", 600))
+
+
+# ============ ON-DISK FORECAST STORE ============
+class ForecastStore:
+    """SQLite store of packed float32 forecasts per grid cell, read lazily after a restart"""
+
+    def __init__(self, path=FORECAST_STORE):
+        self.path = path
+        self._db = None
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS forecasts ("
+                "cell_lat INTEGER, cell_lon INTEGER, run_at INTEGER, expires_at REAL, payload BLOB, "
+                "PRIMARY KEY (cell_lat, cell_lon))"
+            )
+            self._db.commit()
+        return self._db
+
+    def _get(self, cell):
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT expires_at, payload FROM forecasts WHERE cell_lat = ? AND cell_lon = ? AND expires_at > ?",
+                (cell[0], cell[1], time.time())
+            ).fetchone()
+        if row is None:
+            return None
+        try:
+            return row[0], Forecast.from_bytes(row[1])
+        except (ValueError, struct.error):
+            return None  # written by an older version; refetch
+
+    def _put(self, cell, data, expires_at):
+        payload = data.to_bytes()
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO forecasts VALUES (?, ?, ?, ?, ?)",
+                (cell[0], cell[1], data.forecast_run or 0, expires_at, payload)
+            )
+            now = time.time()
+            if now - self._last_prune > FORECAST_STORE_PRUNE_SECONDS:
+                db.execute("DELETE FROM forecasts WHERE expires_at <= ?", (now,))
+                self._last_prune = now
+            db.commit()
+
+    async def get(self, cell):
+        """(expires_at, data) for a still-valid stored forecast, or None"""
+        entry = await asyncio.to_thread(self._get, cell)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    async def put(self, cell, data, expires_at):
+        await asyncio.to_thread(self._put, cell, data, expires_at)
+        self.writes += 1
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "writes": self.writes}
@@ -0,0 +1,172 @@
+import os
+import csv
+import math
+import mmap
+import struct
+from functools import lru_cache
+import numpy as np
+from dotenv import load_dotenv
+
+# ============ CONFIGURATION ============
+load_dotenv()
+GAZETTEER_CSV = os.getenv("GAZETTEER_CSV", "gazetteer.csv")        # name,district,state,latitude,longitude
+GAZETTEER_INDEX = os.getenv("GAZETTEER_INDEX", "gazetteer.idx")    # compiled at build time: python main.py build-index
+GEOCODER_CELL = float(os.getenv("GEOCODER_CELL", 0.5))             # index grid, degrees
+GEOCODER_MAX_KM = float(os.getenv("GEOCODER_MAX_KM", 60))          # further than this -> show coordinates
+GEOCODER_NEAR_KM = float(os.getenv("GEOCODER_NEAR_KM", 5))         # closer than this -> just the place name
+
+KM_PER_DEGREE = 111.32
+
+_MAGIC = b"MGZ1"
+_HEADER = struct.Struct("<4sdiii")   # magic, cell size, cells, places, label bytes
+
+
+# ============ INDEX BUILD ============
+def _cell_keys(lat, lon, cell):
+    """Row-major grid cell number for each point"""
+    cols = math.ceil(360 / cell)
+    rows = np.floor((np.asarray(lat) + 90) / cell).astype(np.int64)
+    return rows * cols + np.floor((np.asarray(lon) + 180) / cell).astype(np.int64)
+
+
+def build_index(csv_path=GAZETTEER_CSV, index_path=GAZETTEER_INDEX, cell=GEOCODER_CELL):
+    """Compile the gazetteer CSV into a grid index: places sorted by cell, plus per-cell offsets"""
+    labels, lats, lons = [], [], []
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            name, district = row["name"].strip(), row["district"].strip()
+            labels.append(f"{name}, {district}" if district and district != name
+                          else f"{name}, {row['state'].strip()}")
+            lats.append(float(row["latitude"]))
+            lons.append(float(row["longitude"]))
+
+    keys = _cell_keys(lats, lons, cell)
+    order = np.argsort(keys, kind="stable")
+    cells, starts = np.unique(keys[order], return_index=True)
+    encoded = [labels[i].encode() for i in order]
+    label_offsets = np.zeros(len(encoded) + 1, dtype=np.int32)
+    label_offsets[1:] = np.cumsum([len(label) for label in encoded])
+    label_bytes = b"".join(encoded)
+
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, cell, len(cells), len(order), len(label_bytes)))
+        f.write(cells.astype(np.int64).tobytes())
+        f.write(np.append(starts, len(order)).astype(np.int32).tobytes())
+        f.write(np.asarray(lats, dtype=np.float32)[order].tobytes())
+        f.write(np.asarray(lons, dtype=np.float32)[order].tobytes())
+        f.write(label_offsets.tobytes())
+        f.write(label_bytes)
+    os.replace(tmp_path, index_path)
+    print(f"🗺️ Gazetteer index built: {len(order)} places in {len(cells)} cells")
+    return index_path
+
+
+# ============ LOOKUP ============
+class Geocoder:
+    """Nearest gazetteer place from a memory-mapped grid index; nothing is parsed at startup"""
+
+    def __init__(self, index_path=GAZETTEER_INDEX, max_km=GEOCODER_MAX_KM):
+        self.max_km = max_km
+        with open(index_path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.cell, n_cells, n_places, n_bytes = _HEADER.unpack_from(self._map)
+        if magic != _MAGIC:
+            raise ValueError(f"{index_path} is not a gazetteer index")
+        self._cols = math.ceil(360 / self.cell)
+
+        pos = _HEADER.size
+        def view(dtype, count):
+            nonlocal pos
+            array = np.frombuffer(self._map, dtype=dtype, count=count, offset=pos)
+            pos += array.nbytes
+            return array
+        self._cells = view(np.int64, n_cells)
+        self._starts = view(np.int32, n_cells + 1)
+        self._lat = view(np.float32, n_places)
+        self._lon = view(np.float32, n_places)
+        self._label_offsets = view(np.int32, n_places + 1)
+        self._labels_at = pos
+
+    def __len__(self):
+        return len(self._lat)
+
+    def label(self, index):
+        start, end = self._label_offsets[index], self._label_offsets[index + 1]
+        return self._map[self._labels_at + start:self._labels_at + end].decode()
+
+    def nearest(self, lat, lon):
+        """(place label, distance in km) of the closest place within max_km, or None"""
+        scale = max(math.cos(math.radians(lat)), 0.01)
+        rings = math.ceil(self.max_km / (KM_PER_DEGREE * self.cell * scale))
+        row = math.floor((lat + 90) / self.cell)
+        col = math.floor((lon + 180) / self.cell)
+
+        # Places are sorted by cell, so each row of the search window is one contiguous slice
+        rows = np.arange(row - rings, row + rings + 1, dtype=np.int64) * self._cols
+        first = np.searchsorted(self._cells, rows + (col - rings))
+        last = np.searchsorted(self._cells, rows + (col + rings), side="right")
+        spans = [(self._starts[a], self._starts[b]) for a, b in zip(first, last) if b > a]
+        if not spans:
+            return None
+
+        candidates = np.concatenate([np.arange(a, b) for a, b in spans])
+        dlat = self._lat[candidates] - lat
+        dlon = (self._lon[candidates] - lon) * scale
+        distances = np.hypot(dlat, dlon)
+        best = int(np.argmin(distances))
+        km = float(distances[best]) * KM_PER_DEGREE
+        if km > self.max_km:
+            return None
+        return self.label(int(candidates[best])), km
+
+    def close(self):
+        self._map.close()
+
+
+def _open_geocoder():
+    # Runs inside a farmer's reply, so it only maps the index; compiling it is a build step
+    if not os.path.exists(GAZETTEER_INDEX):
+        print(f"⚠️ Reverse geocoding disabled: {GAZETTEER_INDEX} missing, run python main.py build-index")
+        return None
+    if os.path.exists(GAZETTEER_CSV) and os.path.getmtime(GAZETTEER_INDEX) < os.path.getmtime(GAZETTEER_CSV):
+        print(f"⚠️ {GAZETTEER_INDEX} is older than {GAZETTEER_CSV}, run python main.py build-index")
+    try:
+        return Geocoder()
+    except (OSError, ValueError, struct.error) as e:
+        print(f"⚠️ Reverse geocoding disabled: {e}")
+        return None
+
+
+_geocoder = None
+_geocoder_opened = False
+
+
+def get_geocoder():
+    """Shared Geocoder, opened on first use; None if no gazetteer is available"""
+    global _geocoder, _geocoder_opened
+    if not _geocoder_opened:
+        _geocoder = _open_geocoder()
+        _geocoder_opened = True
+    return _geocoder
+
+
+@lru_cache(maxsize=4096)
+def _place_name(lat, lon):
+    geocoder = get_geocoder()
+    place = geocoder.nearest(lat, lon) if geocoder else None
+    if place is None:
+        return f"{lat:.2f}, {lon:.2f}"
+    label, km = place
+    if km < GEOCODER_NEAR_KM:
+        return label
+    return f"{km:.0f} km from {label}"
+
+
+def place_name(lat, lon):
+    """Human-readable farm location, falling back to coordinates away from any known place"""
+    return _place_name(round(lat, 2), round(lon, 2))
+
+
+if __name__ == "__main__":
+    build_index()
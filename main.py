@@ -0,0 +1,68 @@
+import sys
+import argparse
+import startup
+
+# Only the chosen command's dependencies are imported, and each import is timed
+
+
+# ============ COMMANDS ============
+def webhook(args):
+    """ASGI webhook server (Railway web process)"""
+    startup.load("telegram.ext", "numpy", "starlette.applications", "uvicorn", "meghdoot")
+    import meghdoot
+    meghdoot.serve(args.port)
+
+
+def polling(args):
+    """Long-polling bot, for running without a public URL"""
+    startup.load("telegram.ext", "numpy", "meghdoot_weather")
+    import meghdoot_weather
+    meghdoot_weather.main()
+
+
+def set_webhook(args):
+    """Register the webhook with Telegram and verify it"""
+    import set_webhook
+    return set_webhook.main(args.extra)
+
+
+def build_index(args):
+    """Compile gazetteer.csv into the memory-mapped place index (deploy build step)"""
+    import geocoder
+    geocoder.build_index()
+
+
+def build_normals(args):
+    """Average IMD gridded temperature files into the climate normals file"""
+    import climatology
+    return climatology.main(args.extra)
+
+
+def diagnose(args):
+    """Check the token, Telegram connectivity and the deployed webhook"""
+    import runpy
+    runpy.run_module("diagnose", run_name="__main__")
+
+
+# ============ MAIN ============
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="main.py", description="Meghdoot weather bot")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("webhook", help=webhook.__doc__)
+    serve.add_argument("--port", type=int, default=None, help="listen port (default: $PORT or 5000)")
+    serve.set_defaults(run=webhook)
+    commands.add_parser("polling", help=polling.__doc__).set_defaults(run=polling)
+    # Their options, --help included, belong to set_webhook.py and climatology.py
+    commands.add_parser("set-webhook", help=set_webhook.__doc__, add_help=False).set_defaults(run=set_webhook)
+    commands.add_parser("build-normals", help=build_normals.__doc__, add_help=False).set_defaults(run=build_normals)
+    commands.add_parser("build-index", help=build_index.__doc__).set_defaults(run=build_index)
+    commands.add_parser("diagnose", help=diagnose.__doc__).set_defaults(run=diagnose)
+
+    args, args.extra = parser.parse_known_args(argv)
+    if args.extra and args.command not in ("set-webhook", "build-normals"):
+        parser.error(f"unrecognized arguments: {' '.join(args.extra)}")
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,128 +1,350 @@
 import os
-import requests
 from datetime import datetime
 from telegram import Update, KeyboardButton, ReplyKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, filters
 from dotenv import load_dotenv
-from flask import Flask, request
-import asyncio
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, JSONResponse
+from starlette.routing import Route
+import contextlib
+import hmac
+import time
+import startup
+import weather_service
+from forecast_stats import aggregate
+from climatology import climate_advice
+from geocoder import place_name
+from message_cache import rendered_messages, message_key
+from update_queue import UpdateQueue, FULL
+from update_filter import UpdateFilter
+from set_webhook import WEBHOOK_BASE_URL, WEBHOOK_SECRET, SECRET_HEADER, webhook_url, webhook_params
+from send_queue import OutboundSender
+from subscriptions import (SubscriptionRegistry, BroadcastScheduler, parse_send_time,
+                           format_send_time, DEFAULT_SEND_TIME)
+from alerts import AlertEngine
+from charts import charts, CHARTS_AVAILABLE, LOCATION_CHARTS
+from chat_state import chat_state
+from state_backend import shared_state
+import metrics
+from metrics import track, Gauge, flatten_stats
 
 # ============ CONFIGURATION ============
 load_dotenv()
 TOKEN = os.getenv("TELEGRAM_TOKEN")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot")
 PORT = int(os.environ.get("PORT", 5000))
 
-# Flask app
-app = Flask(__name__)
-
 # ============ WEATHER FUNCTIONS ============
-def get_weather(lat, lon):
+async def get_weather(lat, lon):
     """Fetch weather from Open-Meteo"""
     try:
-        url = "https://api.open-meteo.com/v1/forecast"
-        params = {
-            "latitude": lat,
-            "longitude": lon,
-            "hourly": "temperature_2m",
-            "forecast_days": 3,
-            "timezone": "auto"
-        }
-        r = requests.get(url, params=params, timeout=10)
-        return r.json()
-    except:
+        return await weather_service.get_forecast(lat, lon)
+    except Exception as e:
+        metrics.errors.inc("weather_fetch")
+        print(f"⚠️ Weather fetch failed for {lat:.2f}, {lon:.2f}: {e!r}")
         return None
 
-def format_weather(data, location="Your Farm"):
+WEATHER_HEADER = "🌾 *Meghdoot Weather* 🌾\n📍 {location}\n⏰ {time}\n\n"
+WEATHER_CURRENT = "*🌡️ Current:* {temp:.1f}°C\n\n*📅 3-Day Forecast:*\n"
+WEATHER_DAY = "• {day}: {low:.0f}-{high:.0f}°C, 🌧️ {rain:.0f} mm\n"
+
+def weather_body(data):
+    """Everything below the header - identical for a whole grid cell and run"""
+    temp = data.series('temperature_2m')[0]
+    daily = aggregate(data, days=3)
+
+    parts = [WEATHER_CURRENT.format(temp=temp)]
+    for day in range(3):
+        date = data.time(day * 24)
+        parts.append(WEATHER_DAY.format(
+            day=date.strftime('%a'),
+            low=daily['temp_min'][day],
+            high=daily['temp_max'][day],
+            rain=daily['rain_total'][day]
+        ))
+
+    parts.append("\n*💡 Advice:*\n")
+    climate = climate_advice(data, daily)
+    if temp > 35:
+        parts.append("• 🔥 Heat stress - irrigate\n")
+    elif temp < 10:
+        parts.append("• ❄️ Frost risk - protect crops\n")
+    elif climate is None:
+        parts.append("• 🌱 Normal conditions\n")
+    if climate is not None:
+        parts.append(climate)
+    if daily['heat_stress_hours'].sum() > 0:
+        parts.append(f"• 🥵 Heat-stress hours ahead: {daily['heat_stress_hours'].sum()}\n")
+    parts.append("• 💧 Water in early morning\n")
+    return "".join(parts)
+
+def format_weather(data, location="Your Farm", lang="en"):
     """Format weather message"""
     if not data:
         return "❌ Weather data unavailable"
     
+    started = time.perf_counter()
     try:
-        hourly = data['hourly']
-        temp = hourly['temperature_2m'][0]
-        temps = hourly['temperature_2m'][:72]
-        
-        msg = f"🌾 *Meghdoot Weather* 🌾\n"
-        msg += f"📍 {location}\n"
-        msg += f"⏰ {datetime.now().strftime('%d %b %I:%M %p')}\n\n"
-        msg += f"*🌡️ Current:* {temp:.1f}°C\n\n"
-        msg += f"*📅 3-Day Forecast:*\n"
-        
-        for day in range(3):
-            start = day * 24
-            day_temps = temps[start:start+24]
-            day_min = min(day_temps)
-            day_max = max(day_temps)
-            date = datetime.fromisoformat(hourly['time'][start].replace('Z', '+00:00'))
-            msg += f"• {date.strftime('%a')}: {day_min:.0f}-{day_max:.0f}°C\n"
-        
-        msg += f"\n*💡 Advice:*\n"
-        if temp > 35:
-            msg += "• 🔥 Heat stress - irrigate\n"
-        elif temp < 10:
-            msg += "• ❄️ Frost risk - protect crops\n"
-        else:
-            msg += "• 🌱 Normal conditions\n"
-        msg += "• 💧 Water in early morning\n"
-        
-        return msg
+        body = rendered_messages.get_or_render(message_key(data, lang, "short"), lambda: weather_body(data))
+        header = WEATHER_HEADER.format(location=location, time=datetime.now().strftime('%d %b %I:%M %p'))
+        return header + body
     except:
+        metrics.errors.inc("format_weather")
         return "❌ Error processing weather"
+    finally:
+        metrics.format_latency.since(started)
 
 # ============ BOT HANDLERS ============
+sender = OutboundSender()
+
+@track("start")
 async def start(update, context):
     """Start command"""
     keyboard = [[KeyboardButton("📍 Share Location", request_location=True)]]
     reply = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-    await update.message.reply_text(
+    await sender.send(
+        update.effective_chat.id,
         "🌾 *Meghdoot Weather Bot*\n\nShare your location for forecast ⬇️",
         parse_mode='Markdown',
         reply_markup=reply
     )
 
+@track("location")
 async def location(update, context):
     """Location handler"""
     loc = update.message.location
     lat, lon = loc.latitude, loc.longitude
     
     await update.message.chat.send_action(action="typing")
-    weather = get_weather(lat, lon)
+    weather = await get_weather(lat, lon)
     
     if weather:
-        msg = format_weather(weather, f"{lat:.2f}, {lon:.2f}")
-        await update.message.reply_text(msg, parse_mode='Markdown')
+        msg = format_weather(weather, place_name(lat, lon))
+        await sender.send(update.effective_chat.id, msg, parse_mode='Markdown')
     else:
-        await update.message.reply_text("❌ Weather fetch failed")
+        await sender.send(update.effective_chat.id, "❌ Weather fetch failed")
+        return
+    chat_state.set_location(update.effective_chat.id, lat, lon)
+    if LOCATION_CHARTS and CHARTS_AVAILABLE:
+        await send_chart(update.effective_chat.id, weather, lat, lon)
+
+    minute = context.chat_data.pop('subscribe_at', None)
+    if minute is not None:
+        await subscriptions.subscribe(update.effective_chat.id, lat, lon, minute,
+                                      weather.utc_offset_seconds)
+        await sender.send(update.effective_chat.id, f"🔔 Subscribed! Daily forecast at {format_send_time(minute)}")
+
+async def send_chart(chat_id, weather, lat, lon):
+    """3-day temperature chart, rendered once per cell and run"""
+    try:
+        await charts.send(sender, chat_id, weather, caption=f"📈 {place_name(lat, lon)}")
+    except Exception as e:
+        metrics.errors.inc("chart")
+        print(f"⚠️ Chart failed for {lat:.2f}, {lon:.2f}: {e!r}")
+        await sender.send(chat_id, "❌ Chart unavailable right now")
+
+@track("chart")
+async def chart(update, context):
+    """Chart command - temperature curve for the last shared location"""
+    if not CHARTS_AVAILABLE:
+        await sender.send(update.effective_chat.id, "📈 Charts are not available on this server")
+        return
+    state = chat_state.get(update.effective_chat.id)
+    loc = (state.lat, state.lon) if state is not None and state.lat is not None else None
+    sub = subscriptions.get(update.effective_chat.id)
+    if loc is None and sub is not None:
+        loc = (sub.lat, sub.lon)
+    if loc is None:
+        await sender.send(update.effective_chat.id, "📍 Share your location first, then use /chart")
+        return
+    lat, lon = loc
+    weather = await get_weather(lat, lon)
+    if weather:
+        await send_chart(update.effective_chat.id, weather, lat, lon)
+    else:
+        await sender.send(update.effective_chat.id, "❌ Weather fetch failed")
+
+# ============ SUBSCRIPTIONS ============
+subscriptions = SubscriptionRegistry(shared=shared_state)
+broadcaster = BroadcastScheduler(subscriptions, weather_service.get_scheduled_forecast, format_weather,
+                                 sender, parse_mode='Markdown')
+alerts = AlertEngine(subscriptions, weather_service.get_fresh_forecast, sender, shared=shared_state)
+
+@track("subscribe")
+async def subscribe(update, context):
+    """Subscribe command - daily forecast at a local time"""
+    minute = parse_send_time(context.args[0] if context.args else DEFAULT_SEND_TIME)
+    if minute is None:
+        await sender.send(update.effective_chat.id, "⏰ Usage: /subscribe 06:30")
+        return
+    context.chat_data['subscribe_at'] = minute
+    keyboard = [[KeyboardButton("📍 Share Location", request_location=True)]]
+    reply = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+    await sender.send(
+        update.effective_chat.id,
+        f"📍 Share your farm location to get a forecast every day at {format_send_time(minute)}",
+        reply_markup=reply
+    )
+
+@track("unsubscribe")
+async def unsubscribe(update, context):
+    """Unsubscribe command"""
+    if await subscriptions.unsubscribe(update.effective_chat.id):
+        await sender.send(update.effective_chat.id, "🔕 Daily forecast stopped")
+    else:
+        await sender.send(update.effective_chat.id, "You are not subscribed. Use /subscribe 06:30")
 
 # ============ CREATE APPLICATION - NO POLLING! ============
-bot_app = Application.builder().token(TOKEN).build()
-bot_app.add_handler(CommandHandler("start", start))
-bot_app.add_handler(MessageHandler(filters.LOCATION, location))
-
-# ============ FLASK WEBHOOK ============
-@app.route('/')
-def home():
-    return "🌾 Meghdoot Bot Online! ✅"
-
-@app.route(f'/{TOKEN}', methods=['POST'])
-async def webhook():
-    """Telegram webhook"""
-    update = Update.de_json(request.get_json(), bot_app.bot)
-    await bot_app.process_update(update)
-    return "OK"
+COMMANDS = {"start": start, "subscribe": subscribe, "unsubscribe": unsubscribe, "chart": chart}
+update_filter = UpdateFilter(COMMANDS)
+bot_app = None
+
+def build_bot_app():
+    """Built at server startup, not import: the builder sets up HTTP clients and TLS"""
+    global bot_app
+    bot_app = Application.builder().token(TOKEN).base_url(TELEGRAM_API_URL).build()
+    for command, callback in COMMANDS.items():
+        bot_app.add_handler(CommandHandler(command, callback))
+    bot_app.add_handler(MessageHandler(filters.LOCATION, location))
+    return bot_app
+
+# ============ ASGI WEBHOOK ============
+async def home(request):
+    return PlainTextResponse("🌾 Meghdoot Bot Online! ✅")
+
+def collect_stats():
+    """Cache, update queue, broadcast, alert, chart and outbound send counters"""
+    result = dict(
+        weather_service.stats(),
+        rendered_messages=rendered_messages.stats(),
+        update_queue=update_queue.stats(),
+        update_filter=update_filter.stats(),
+        broadcasts=broadcaster.stats(),
+        alerts=alerts.stats(),
+        charts=charts.stats(),
+        chat_state=chat_state.stats(),
+        sender=sender.stats(),
+        startup=startup.stats()
+    )
+    if shared_state is not None:
+        result["state_backend"] = shared_state.stats()
+    return result
+
+async def stats(request):
+    return JSONResponse(collect_stats())
+
+# Read only when /metrics is scraped
+metrics.registry.add(Gauge(
+    "meghdoot_cache_hit_ratio", "Share of lookups answered from cache", lambda: {
+        ("forecast",): weather_service.forecast_cache.stats()["hit_ratio"],
+        ("messages",): rendered_messages.stats()["hit_ratio"]
+    }, ("cache",)))
+metrics.registry.add(Gauge(
+    "meghdoot_stat", "Numeric counters from /stats", lambda: flatten_stats(collect_stats()),
+    ("component", "name")))
+
+async def prometheus(request):
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+async def process_update(payload):
+    """Worker side: build the Update and run the handlers"""
+    received, data = payload
+    try:
+        update = Update.de_json(data, bot_app.bot)
+        await bot_app.process_update(update)
+    finally:
+        metrics.update_latency.since(received)
+
+update_queue = UpdateQueue(process_update, shared=shared_state)
+
+async def webhook(request):
+    """Telegram webhook - queue the update and acknowledge at once"""
+    received = time.perf_counter()
+    # Checked before the body is even read; compare_digest keeps the check constant-time
+    if WEBHOOK_SECRET and not hmac.compare_digest(
+            request.headers.get(SECRET_HEADER, "").encode(), WEBHOOK_SECRET.encode()):
+        metrics.errors.inc("webhook_secret")
+        return PlainTextResponse("Forbidden", status_code=403)
+    try:
+        data = update_filter.parse(await request.body())
+        if data is None:
+            # Nothing handles it: acknowledge so Telegram doesn't redeliver
+            return PlainTextResponse("OK")
+        update_id = int(data["update_id"])
+    except (ValueError, TypeError, KeyError):
+        return PlainTextResponse("Bad Request", status_code=400)
+    if await update_queue.put(update_id, (received, data)) == FULL:
+        # Non-2xx makes Telegram redeliver later
+        return PlainTextResponse("Busy", status_code=503)
+    return PlainTextResponse("OK")
 
 # ============ INIT ============
 async def init():
     """Initialize bot"""
-    await bot_app.initialize()
-    railway_url = os.environ.get('RAILWAY_STATIC_URL')
-    if railway_url:
-        webhook_url = f"https://{railway_url}/{TOKEN}"
-        await bot_app.bot.set_webhook(url=webhook_url)
-        print(f"✅ Webhook: {webhook_url}")
+    with startup.phase("build application"):
+        build_bot_app()
+    with startup.phase("bot initialize (getMe)"):
+        await bot_app.initialize()
+    if WEBHOOK_BASE_URL:
+        url = webhook_url(WEBHOOK_BASE_URL)
+        await bot_app.bot.set_webhook(**webhook_params(url))
+        print(f"✅ Webhook: {url}")
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    """Bot, HTTP listener and upstream pool all share the server's event loop"""
+    await init()
+    with startup.phase("start services"):
+        await bot_app.start()
+        await update_queue.start()
+        sender.start(bot_app.bot)
+        subscriptions.load()
+        await subscriptions.sync()
+        broadcaster.start()
+        weather_service.prefetcher.start()
+        alerts.load()
+        alerts.start()
+        chat_state.load()
+        chat_state.start()
+        charts.start()
+    startup.ready()
+    try:
+        yield
+    finally:
+        # Drain queued updates first: their handlers still need subscriptions, alerts and chat state
+        await update_queue.stop()
+        await chat_state.stop()
+        await alerts.stop()
+        alerts.close()
+        await broadcaster.stop()
+        await subscriptions.flush()
+        subscriptions.close()
+        await weather_service.prefetcher.stop()
+        await sender.stop()
+        await bot_app.stop()
+        await bot_app.shutdown()
+        await weather_service.close()
+        if shared_state is not None:
+            await shared_state.close()
+        charts.close()
+
+app = Starlette(
+    routes=[
+        Route('/', home),
+        Route('/stats', stats),
+        Route('/metrics', prometheus),
+        Route(f'/{TOKEN}', webhook, methods=['POST'])
+    ],
+    lifespan=lifespan
+)
 
 # ============ MAIN ============
+def serve(port=None):
+    import uvicorn
+    port = port or PORT
+    print(f"🚀 Server on 0.0.0.0:{port}")
+    uvicorn.run(app, host="0.0.0.0", port=port, proxy_headers=True, access_log=False)
+
 if __name__ == "__main__":
-    asyncio.run(init())
-    print(f"🚀 Server on 0.0.0.0:{PORT}")
-    app.run(host="0.0.0.0", port=PORT)
\ No newline at end of file
+    serve()
@@ -1,10 +1,13 @@
 import os
 import logging
 from telegram import Update, KeyboardButton, ReplyKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-from telegram.request import HTTPXRequest
+from telegram.ext import CommandHandler, MessageHandler, filters, ContextTypes
 from dotenv import load_dotenv
-import httpx
+from polling import polling_builder, wait_for_stop, POLL_TIMEOUT
+import weather_service
+from geocoder import place_name
+from chat_state import chat_state
+from meghdoot_weather import format_weather_message
 
 # Enable logging
 logging.basicConfig(
@@ -22,18 +25,12 @@ TOKEN = os.getenv('TELEGRAM_TOKEN')
 async def create_application():
     """Create application with proxy support for India"""
     # Try different connection settings
-    request = HTTPXRequest(
-        connection_pool_size=8,
+    application = polling_builder(
+        TOKEN,
         connect_timeout=30.0,
         read_timeout=30.0,
         write_timeout=30.0,
-    )
-    
-    # Create application with custom request object
-    application = Application.builder() \
-        .token(TOKEN) \
-        .request(request) \
-        .build()
+    ).build()
     
     return application
 
@@ -78,16 +75,33 @@ async def handle_location(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         f"🌤️ *Fetching weather data...*",
         parse_mode='Markdown'
     )
+    
+    # Remember the farm so the forecast button works without sharing again
+    chat_state.set_location(update.effective_chat.id, lat, lon)
+    await reply_forecast(update, lat, lon)
+
+async def reply_forecast(update: Update, lat: float, lon: float, lang: str = "en") -> None:
+    """Reply with the (usually cached) forecast for a location."""
+    try:
+        forecast = await weather_service.get_forecast(lat, lon)
+    except Exception as e:
+        logger.warning("Weather fetch failed for %.2f, %.2f: %r", lat, lon, e)
+        forecast = None
+    await update.message.reply_text(format_weather_message(forecast, place_name(lat, lon), lang))
 
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle text messages."""
     text = update.message.text
     
     if text == "🌦️ Get Weather Forecast":
-        await update.message.reply_text(
-            "Please share your location first using the '📍 Share My Farm Location' button.",
-            parse_mode='Markdown'
-        )
+        state = chat_state.get(update.effective_chat.id)
+        if state is not None and state.lat is not None:
+            await reply_forecast(update, state.lat, state.lon, state.lang)
+        else:
+            await update.message.reply_text(
+                "Please share your location first using the '📍 Share My Farm Location' button.",
+                parse_mode='Markdown'
+            )
     elif text == "ℹ️ Help":
         await update.message.reply_text(
             "Share your location to get weather forecasts and farming advice!",
@@ -138,14 +152,22 @@ async def async_main():
     print("🚀 Starting bot polling...")
     
     # Start polling
+    chat_state.load()
+    chat_state.start()
     await application.initialize()
     await application.start()
-    await application.updater.start_polling()
+    await application.updater.start_polling(timeout=POLL_TIMEOUT)
     
     print("🤖 Bot is now running! Press Ctrl+C to stop")
     
-    # Keep running
+    # Keep running until Ctrl+C, then finish in-flight updates
+    await wait_for_stop()
+    print("🛑 Stopping bot...")
+    await application.updater.stop()
     await application.stop()
+    await application.shutdown()
+    await chat_state.stop()
+    await weather_service.close()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -1,8 +1,9 @@
 import os 
 import asyncio 
 from telegram import Update, KeyboardButton, ReplyKeyboardMarkup 
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes 
+from telegram.ext import CommandHandler, MessageHandler, filters, ContextTypes 
 from dotenv import load_dotenv 
+from polling import polling_builder, run_polling 
  
 load_dotenv() 
 TOKEN = os.getenv("TELEGRAM_TOKEN") 
@@ -21,12 +22,12 @@ def main():
     print("?? MEGHDOOT BOT STARTING...") 
     print("=" * 50) 
  
-    app = Application.builder().token(TOKEN).build() 
+    app = polling_builder(TOKEN).build() 
     app.add_handler(CommandHandler("start", start)) 
     app.add_handler(MessageHandler(filters.LOCATION, handle_location)) 
  
     print("? Bot is running! Press Ctrl+C to stop.") 
-    app.run_polling() 
+    run_polling(app) 
  
 if __name__ == "__main__": 
     main() 
@@ -1,8 +1,8 @@
 import os 
 from telegram import Update, KeyboardButton, ReplyKeyboardMarkup 
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes 
-from telegram.request import HTTPXRequest 
+from telegram.ext import CommandHandler, MessageHandler, filters, ContextTypes 
 from dotenv import load_dotenv 
+from polling import polling_builder, run_polling 
  
 load_dotenv() 
 TOKEN = os.getenv("TELEGRAM_TOKEN") 
@@ -20,14 +20,12 @@ async def handle_location(update, context):
 def main(): 
     print("Starting Meghdoot Bot...") 
  
-    request = HTTPXRequest(connect_timeout=30.0, read_timeout=30.0, write_timeout=30.0) 
- 
-    app = Application.builder().token(TOKEN).request(request).build() 
+    app = polling_builder(TOKEN, connect_timeout=30.0, read_timeout=30.0, write_timeout=30.0).build() 
  
     app.add_handler(CommandHandler("start", start)) 
     app.add_handler(MessageHandler(filters.LOCATION, handle_location)) 
  
-    app.run_polling() 
+    run_polling(app) 
  
 if __name__ == "__main__": 
     main() 
@@ -1,112 +1,131 @@
 # -*- coding: utf-8 -*-
 import os
-import requests
-import json
 from datetime import datetime
 from telegram import Update, KeyboardButton, ReplyKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
+from telegram.ext import CommandHandler, MessageHandler, filters, ContextTypes
 from dotenv import load_dotenv
+import weather_service
+from forecast_stats import aggregate
+from climatology import climate_advice
+from geocoder import place_name
+from message_cache import rendered_messages, message_key
+from polling import polling_builder, run_polling
+from send_queue import OutboundSender
+from subscriptions import (SubscriptionRegistry, BroadcastScheduler, parse_send_time,
+                           format_send_time, DEFAULT_SEND_TIME)
+from alerts import AlertEngine
+from charts import charts, CHARTS_AVAILABLE, LOCATION_CHARTS
+from chat_state import chat_state
+import startup
+from state_backend import shared_state
 
 # ============ CONFIGURATION ============
 load_dotenv()
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 WEATHER_API_KEY = os.getenv("WEATHER_API_KEY")
-WEATHER_URL = "https://api.open-meteo.com/v1/forecast"
 
 # ============ WEATHER FUNCTIONS ============
-def get_weather_forecast(lat, lon):
+async def get_weather_forecast(lat, lon):
     try:
-        params = {
-            "lat": lat,
-            "lon": lon,
-            "appid": WEATHER_API_KEY,
-            "units": "metric",
-            "lang": "en"
-        }
-        built_url = WEATHER_URL + f"?latitude={lat}&longitude={lon}&hourly=temperature_2m"
-        response = requests.get(built_url, timeout=10)
-        print(response.json())
-        response.raise_for_status()
-        return response.json()
-    except:
+        return await weather_service.get_forecast(lat, lon)
+    except Exception as e:
+        print(f"⚠️ Weather fetch failed for {lat:.2f}, {lon:.2f}: {e!r}")
         return None
 
-def format_weather_message(weather_data, location_name="Your Farm"):
+ADVISORY_HEADER = "🌾 *Meghdoot Weather Advisory* 🌾\n📍 *Location:* {location}\n⏰ *Time:* {time}\n\n"
+ADVISORY_CURRENT = "*🌡️ CURRENT CONDITIONS:*\n• Temperature: {temp:.1f}°C\n\n*📅 3-DAY FORECAST:*\n"
+ADVISORY_DAY = "• {day_name}, {day_date}: {low:.0f}-{high:.0f}°C, 🌧️ {rain:.1f} mm\n"
+ADVISORY_FOOTER = (
+    "• 🌱 Inspect crops regularly for pest and disease\n"
+    "• 💧 Water plants in early morning or late evening\n"
+    "• 📋 Plan harvesting activities around weather conditions\n"
+    "\n_Data: Open-Meteo | Free Weather API_ ☁️\n"
+    "🔄 Send location again for updated forecast"
+)
+
+def advisory_body(forecast):
+    """Everything below the header - identical for a whole grid cell and run"""
+    temps = forecast.series('temperature_2m')
+
+    # Get current time index (first hour)
+    current_temp = temps[0]
+
+    # Daily stats for the next 3 full days in one vectorized pass
+    days = min(3, len(temps) // 24)
+    daily = aggregate(forecast, days=days)
+    today_forecast = []
+    for day in range(days):
+        today_forecast.append({
+            'date': forecast.time(day * 24),
+            'min': daily['temp_min'][day],
+            'max': daily['temp_max'][day],
+            'rain': daily['rain_total'][day],
+            'gdd': daily['gdd'][day],
+            'heat_hours': daily['heat_stress_hours'][day]
+        })
+
+    parts = [ADVISORY_CURRENT.format(temp=current_temp)]
+    for day in today_forecast:
+        parts.append(ADVISORY_DAY.format(
+            day_name=day['date'].strftime('%a'),
+            day_date=day['date'].strftime('%d %b'),
+            low=day['min'],
+            high=day['max'],
+            rain=day['rain']
+        ))
+
+    parts.append("\n*⚠️ FARMING RECOMMENDATIONS:*\n")
+
+    # Temperature based advice
+    if current_temp > 35:
+        parts.append("• 🔥 Heat stress risk - irrigate early morning, provide shade\n")
+    elif current_temp > 32:
+        parts.append("• ☀️ High temperature - ensure adequate irrigation\n")
+    elif current_temp < 10:
+        parts.append("• ❄️ Frost risk - protect sensitive crops with covers\n")
+    elif current_temp < 15:
+        parts.append("• 🌡️ Cool conditions - delay planting of heat-sensitive crops\n")
+    else:
+        parts.append("• 🌡️ Normal temperature range - regular farming activities\n")
+
+    # How the coming days compare with what is normal here at this time of year
+    if days:
+        climate = climate_advice(forecast, daily)
+        if climate is not None:
+            parts.append(climate)
+
+    # Temperature swing advice (from forecast)
+    if today_forecast:
+        today_swing = today_forecast[0]['max'] - today_forecast[0]['min']
+        if today_swing > 15:
+            parts.append("• 📊 Large temperature swing - monitor crop stress\n")
+        heat_hours = sum(day['heat_hours'] for day in today_forecast)
+        if heat_hours > 0:
+            parts.append(f"• 🥵 {heat_hours} hours above 35°C in the next {days} days - plan shade and irrigation\n")
+        if sum(day['rain'] for day in today_forecast) >= 10:
+            parts.append("• 🌧️ Significant rain expected - postpone spraying and fertilizer\n")
+        gdd = sum(day['gdd'] for day in today_forecast)
+        parts.append(f"• 🌱 Growing degree days (base 10°C): {gdd:.0f} over {days} days\n")
+
+    # General farming advice
+    parts.append(ADVISORY_FOOTER)
+    return "".join(parts)
+
+def format_weather_message(weather_data, location_name="Your Farm", lang="en"):
     if not weather_data:
         return "❌ Unable to fetch weather data."
 
     try:
-        # Extract data from Open-Meteo API format
-        hourly = weather_data.get('hourly', {})
-        times = hourly.get('time', [])
-        temps = hourly.get('temperature_2m', [])
-        
-        if not times or not temps:
+        if not weather_data.hours or not weather_data.series('temperature_2m'):
             return "❌ Incomplete weather data received."
-        
-        # Get current time index (first hour)
-        current_temp = temps[0]
-        
-        # Calculate daily min/max for next 3 days
-        today_forecast = []
-        for day in range(3):  # Next 3 days
-            start_idx = day * 24
-            end_idx = start_idx + 24
-            if end_idx <= len(temps):
-                day_temps = temps[start_idx:end_idx]
-                day_min = min(day_temps)
-                day_max = max(day_temps)
-                day_date = datetime.fromisoformat(times[start_idx].replace('Z', '+00:00'))
-                today_forecast.append({
-                    'date': day_date,
-                    'min': day_min,
-                    'max': day_max
-                })
-        
-        # Build the message
-        message = f"🌾 *Meghdoot Weather Advisory* 🌾\n"
-        message += f"📍 *Location:* {location_name}\n"
-        message += f"⏰ *Time:* {datetime.now().strftime('%d %b %Y, %I:%M %p')}\n\n"
-        
-        message += f"*🌡️ CURRENT CONDITIONS:*\n"
-        message += f"• Temperature: {current_temp:.1f}°C\n"
-        message += f"\n"
-        
-        message += f"*📅 3-DAY FORECAST:*\n"
-        for i, day in enumerate(today_forecast[:3]):
-            day_name = day['date'].strftime('%a')
-            day_date = day['date'].strftime('%d %b')
-            message += f"• {day_name}, {day_date}: {day['min']:.0f}-{day['max']:.0f}°C\n"
-        
-        message += f"\n*⚠️ FARMING RECOMMENDATIONS:*\n"
-        
-        # Temperature based advice
-        if current_temp > 35:
-            message += "• 🔥 Heat stress risk - irrigate early morning, provide shade\n"
-        elif current_temp > 32:
-            message += "• ☀️ High temperature - ensure adequate irrigation\n"
-        elif current_temp < 10:
-            message += "• ❄️ Frost risk - protect sensitive crops with covers\n"
-        elif current_temp < 15:
-            message += "• 🌡️ Cool conditions - delay planting of heat-sensitive crops\n"
-        else:
-            message += "• 🌡️ Normal temperature range - regular farming activities\n"
-        
-        # Temperature swing advice (from forecast)
-        if today_forecast:
-            today_swing = today_forecast[0]['max'] - today_forecast[0]['min']
-            if today_swing > 15:
-                message += "• 📊 Large temperature swing - monitor crop stress\n"
-        
-        # General farming advice
-        message += "• 🌱 Inspect crops regularly for pest and disease\n"
-        message += "• 💧 Water plants in early morning or late evening\n"
-        message += "• 📋 Plan harvesting activities around weather conditions\n"
-        
-        message += f"\n_Data: Open-Meteo | Free Weather API_ ☁️\n"
-        message += f"🔄 Send location again for updated forecast"
-        
-        return message
+
+        key = message_key(weather_data, lang, "full")
+        body = rendered_messages.get_or_render(key, lambda: advisory_body(weather_data))
+        header = ADVISORY_HEADER.format(
+            location=location_name,
+            time=datetime.now().strftime('%d %b %Y, %I:%M %p')
+        )
+        return header + body
     
     except Exception as e:
         print(f"Error formatting weather: {e}")
@@ -116,10 +135,13 @@ def format_weather_message(weather_data, location_name="Your Farm"):
     
     
 # ============ TELEGRAM HANDLERS ============
+sender = OutboundSender()
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     keyboard = [[KeyboardButton("📍 Share Farm Location", request_location=True)]]
     reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-    await update.message.reply_text(
+    await sender.send(
+        update.effective_chat.id,
         "🌾 Welcome to Meghdoot Weather Bot!\n\nShare your location to get weather forecast.",
         reply_markup=reply_markup
     )
@@ -129,21 +151,115 @@ async def handle_location(update: Update, context: ContextTypes.DEFAULT_TYPE):
     lat, lon = location.latitude, location.longitude
 
     await update.message.chat.send_action(action="typing")
-    await update.message.reply_text("⏳ Fetching weather data...")
+    await sender.send(update.effective_chat.id, "⏳ Fetching weather data...")
 
-    weather_data = get_weather_forecast(lat, lon)
+    weather_data = await get_weather_forecast(lat, lon)
    
     if weather_data:
-        message = format_weather_message(weather_data, f"{lat:.2f}, {lon:.2f}")
-        await update.message.reply_text(message)
+        message = format_weather_message(weather_data, place_name(lat, lon))
+        await sender.send(update.effective_chat.id, message)
     else:
-        await update.message.reply_text("❌ Weather API Error. Check your API key. ")
+        await sender.send(update.effective_chat.id, "❌ Weather API Error. Check your API key. ")
+        return
+    chat_state.set_location(update.effective_chat.id, lat, lon)
+    if LOCATION_CHARTS and CHARTS_AVAILABLE:
+        await send_chart(update.effective_chat.id, weather_data, lat, lon)
+
+    minute = context.chat_data.pop('subscribe_at', None)
+    if minute is not None:
+        await subscriptions.subscribe(update.effective_chat.id, lat, lon, minute,
+                                      weather_data.utc_offset_seconds)
+        await sender.send(update.effective_chat.id, f"🔔 Subscribed! Daily forecast at {format_send_time(minute)}")
+
+async def send_chart(chat_id, weather_data, lat, lon):
+    try:
+        await charts.send(sender, chat_id, weather_data, caption=f"📈 {place_name(lat, lon)}")
+    except Exception as e:
+        print(f"⚠️ Chart failed for {lat:.2f}, {lon:.2f}: {e!r}")
+        await sender.send(chat_id, "❌ Chart unavailable right now")
+
+async def chart(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not CHARTS_AVAILABLE:
+        await sender.send(update.effective_chat.id, "📈 Charts are not available on this server")
+        return
+    state = chat_state.get(update.effective_chat.id)
+    location = (state.lat, state.lon) if state is not None and state.lat is not None else None
+    sub = subscriptions.get(update.effective_chat.id)
+    if location is None and sub is not None:
+        location = (sub.lat, sub.lon)
+    if location is None:
+        await sender.send(update.effective_chat.id, "📍 Share your farm location first, then use /chart")
+        return
+    lat, lon = location
+    weather_data = await get_weather_forecast(lat, lon)
+    if weather_data:
+        await send_chart(update.effective_chat.id, weather_data, lat, lon)
+    else:
+        await sender.send(update.effective_chat.id, "❌ Unable to fetch weather data.")
+
+async def subscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    minute = parse_send_time(context.args[0] if context.args else DEFAULT_SEND_TIME)
+    if minute is None:
+        await sender.send(update.effective_chat.id, "⏰ Usage: /subscribe 06:30")
+        return
+    context.chat_data['subscribe_at'] = minute
+    keyboard = [[KeyboardButton("📍 Share Farm Location", request_location=True)]]
+    reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+    await sender.send(
+        update.effective_chat.id,
+        f"📍 Share your farm location to get a forecast every day at {format_send_time(minute)}",
+        reply_markup=reply_markup
+    )
+
+async def unsubscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if await subscriptions.unsubscribe(update.effective_chat.id):
+        await sender.send(update.effective_chat.id, "🔕 Daily forecast stopped")
+    else:
+        await sender.send(update.effective_chat.id, "You are not subscribed. Use /subscribe 06:30")
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(
-        "Commands:\n/start - Start bot\n/help - Show help\n\nShare location for weather forecast."
+    await sender.send(
+        update.effective_chat.id,
+        "Commands:\n/start - Start bot\n/help - Show help\n"
+        "/subscribe 06:30 - Daily forecast at a set time\n/unsubscribe - Stop daily forecast\n"
+        "/chart - 3-day temperature chart\n\n"
+        "Share location for weather forecast."
     )
 
+# ============ SUBSCRIPTIONS ============
+subscriptions = SubscriptionRegistry(shared=shared_state)
+broadcaster = BroadcastScheduler(subscriptions, weather_service.get_scheduled_forecast,
+                                 format_weather_message, sender)
+alerts = AlertEngine(subscriptions, weather_service.get_fresh_forecast, sender, shared=shared_state)
+
+async def post_init(app):
+    with startup.phase("start services"):
+        sender.start(app.bot)
+        subscriptions.load()
+        await subscriptions.sync()
+        broadcaster.start()
+        weather_service.prefetcher.start()
+        alerts.load()
+        alerts.start()
+        chat_state.load()
+        chat_state.start()
+        charts.start()
+    startup.ready()
+
+async def post_shutdown(app):
+    await chat_state.stop()
+    await alerts.stop()
+    alerts.close()
+    await broadcaster.stop()
+    await subscriptions.flush()
+    subscriptions.close()
+    await weather_service.prefetcher.stop()
+    await sender.stop()
+    await weather_service.close()
+    if shared_state is not None:
+        await shared_state.close()
+    charts.close()
+
 # ============ MAIN ============
 def main():
     print("=" * 50)
@@ -157,13 +273,17 @@ def main():
         print("❌ WEATHER_API_KEY not found")
         return
 
-    app = Application.builder().token(TELEGRAM_TOKEN).build()
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("help", help_command))
-    app.add_handler(MessageHandler(filters.LOCATION, handle_location))
+    with startup.phase("build application"):
+        app = polling_builder(TELEGRAM_TOKEN).post_init(post_init).post_shutdown(post_shutdown).build()
+        app.add_handler(CommandHandler("start", start))
+        app.add_handler(CommandHandler("help", help_command))
+        app.add_handler(CommandHandler("subscribe", subscribe))
+        app.add_handler(CommandHandler("unsubscribe", unsubscribe))
+        app.add_handler(CommandHandler("chart", chart))
+        app.add_handler(MessageHandler(filters.LOCATION, handle_location))
 
     print("✅ Bot is running!")
-    app.run_polling()
+    run_polling(app)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,52 @@
+import os
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+# ============ CONFIGURATION ============
+load_dotenv()
+MESSAGE_CACHE_SIZE = int(os.getenv("MESSAGE_CACHE_SIZE", 20000))
+
+
+# ============ RENDERED MESSAGE CACHE ============
+def message_key(data, language, detail):
+    """(grid cell, forecast run, language, detail) for a cached forecast, None if not cacheable"""
+    if data.grid_cell is None or data.forecast_run is None:
+        return None
+    return (data.grid_cell, data.forecast_run, language, detail)
+
+
+class MessageCache:
+    """LRU of rendered message bodies; everyone in a cell gets the same text for a run"""
+
+    def __init__(self, max_size=MESSAGE_CACHE_SIZE):
+        self.max_size = max_size
+        self._bodies = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, key, render_body):
+        """Cached body for `key`, calling render_body() only on a miss"""
+        if key is None:
+            return render_body()
+        body = self._bodies.get(key)
+        if body is not None:
+            self.hits += 1
+            self._bodies.move_to_end(key)
+            return body
+        self.misses += 1
+        body = self._bodies[key] = render_body()
+        if len(self._bodies) > self.max_size:
+            self._bodies.popitem(last=False)
+        return body
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._bodies),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+rendered_messages = MessageCache()
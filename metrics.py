@@ -0,0 +1,150 @@
+import time
+import functools
+from bisect import bisect_left
+
+# ============ CONFIGURATION ============
+# Seconds; covers a cache hit (sub-ms) up to a slow Open-Meteo timeout
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# ============ METRIC TYPES ============
+# Recording is a few integer/float updates; all formatting happens at scrape time
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    """Monotonic count, optionally split by label values"""
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for values, count in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labels, values)} {count}")
+        return lines
+
+
+class Histogram:
+    """Latency distribution with fixed buckets"""
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+
+    def observe(self, seconds):
+        self._counts[bisect_left(self.buckets, seconds)] += 1
+        self._sum += seconds
+
+    def since(self, started):
+        """Observe the time elapsed since a perf_counter() reading"""
+        self.observe(time.perf_counter() - started)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.buckets, self._counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        cumulative += self._counts[-1]
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {cumulative}')
+        lines.append(f"{self.name}_sum {self._sum}")
+        lines.append(f"{self.name}_count {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Value read from a callback only when scraped: {label values: number} or a number"""
+
+    def __init__(self, name, help, read, labels=()):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.labels = labels
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        values = self.read()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for label_values, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.labels, label_values)} {float(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # A broken gauge callback must not take the whole scrape down
+                lines.append(f"# {metric.name} unavailable: {e!r}")
+        return "\n".join(lines) + "\n"
+
+
+def flatten_stats(stats, prefix=()):
+    """{component: {name: number}} -> {(component, name): number}, skipping non-numbers"""
+    flat = {}
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            flat.update(flatten_stats(value, prefix + (key,)))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[(".".join(prefix), key)] = value
+    return flat
+
+
+# ============ HOT-PATH METRICS ============
+registry = Registry()
+update_latency = registry.add(Histogram(
+    "meghdoot_update_seconds", "Webhook receipt to handler finished (reply sent)"))
+upstream_latency = registry.add(Histogram(
+    "meghdoot_upstream_seconds", "Open-Meteo request latency"))
+format_latency = registry.add(Histogram(
+    "meghdoot_format_seconds", "Forecast message formatting time"))
+send_latency = registry.add(Histogram(
+    "meghdoot_send_seconds", "Telegram Bot API call latency for outbound messages"))
+handler_updates = registry.add(Counter(
+    "meghdoot_updates_total", "Updates handled, by handler", ("handler",)))
+errors = registry.add(Counter(
+    "meghdoot_errors_total", "Exceptions caught and handled instead of crashing", ("where",)))
+
+
+def track(handler):
+    """Count a handler's updates and escaped exceptions"""
+    def wrap(callback):
+        @functools.wraps(callback)
+        async def tracked(update, context):
+            handler_updates.inc(handler)
+            try:
+                return await callback(update, context)
+            except Exception:
+                errors.inc(handler)
+                raise
+        return tracked
+    return wrap
@@ -0,0 +1,105 @@
+import os
+import signal
+import asyncio
+from telegram.ext import Application, BaseUpdateProcessor, ExtBot
+from telegram.request import HTTPXRequest
+from dotenv import load_dotenv
+from update_filter import ALLOWED_UPDATES
+
+# ============ CONFIGURATION ============
+load_dotenv()
+POLL_TIMEOUT = int(os.getenv("POLL_TIMEOUT", 30))          # long-poll seconds
+POLL_LIMIT = int(os.getenv("POLL_LIMIT", 100))             # updates per getUpdates batch
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", 32))
+# Ceiling on queued + running updates; far above any real backlog so a busy chat can't reach it
+MAX_PENDING_UPDATES = int(os.getenv("MAX_PENDING_UPDATES", 10000))
+# Point at a local Bot API server (or the benchmark's fake one) instead of Telegram
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot")
+
+
+# ============ DISPATCHER ============
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Runs different chats concurrently while keeping each chat's updates in order"""
+
+    __slots__ = ("_running", "_chat_locks", "deepest_backlog")
+
+    def __init__(self, max_concurrent_updates=MAX_CONCURRENT_UPDATES,
+                 max_pending_updates=MAX_PENDING_UPDATES):
+        # PTB holds its semaphore around do_process_update, waiting for the chat lock included,
+        # so it gets the pending ceiling; our own semaphore bounds updates actually running
+        super().__init__(max(max_pending_updates, max_concurrent_updates))
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._chat_locks = {}  # chat_id -> [lock, waiting + running updates]
+        self.deepest_backlog = 0
+
+    async def do_process_update(self, update, coroutine):
+        chat = getattr(update, "effective_chat", None)
+        if chat is None:
+            async with self._running:
+                await coroutine
+            return
+
+        entry = self._chat_locks.get(chat.id)
+        if entry is None:
+            entry = self._chat_locks[chat.id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        self.deepest_backlog = max(self.deepest_backlog, entry[1] - 1)
+        try:
+            # Take the chat lock before a running slot so a busy chat's backlog holds no slots
+            async with entry[0]:
+                async with self._running:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._chat_locks[chat.id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def stats(self):
+        return {"chats_waiting": len(self._chat_locks), "deepest_backlog": self.deepest_backlog}
+
+
+class PollingBot(ExtBot):
+    """ExtBot whose long polls fetch up to POLL_LIMIT updates per request"""
+
+    __slots__ = ("poll_limit",)
+
+    def __init__(self, *args, poll_limit=POLL_LIMIT, **kwargs):
+        super().__init__(*args, **kwargs)
+        with self._unfrozen():
+            self.poll_limit = poll_limit
+
+    async def get_updates(self, offset=None, limit=None, *args, **kwargs):
+        return await super().get_updates(offset, limit or self.poll_limit, *args, **kwargs)
+
+
+# ============ APPLICATION ============
+def polling_builder(token, **request_kwargs):
+    """ApplicationBuilder wired with the chat-ordered dispatcher and tuned long polling"""
+    request = HTTPXRequest(connection_pool_size=MAX_CONCURRENT_UPDATES + 8, **request_kwargs)
+    get_updates_request = HTTPXRequest(**request_kwargs)
+    bot = PollingBot(token, base_url=TELEGRAM_API_URL, request=request,
+                     get_updates_request=get_updates_request)
+    return Application.builder().bot(bot).concurrent_updates(ChatOrderedUpdateProcessor())
+
+
+def run_polling(app):
+    """Poll until Ctrl+C/SIGTERM, then finish in-flight updates before exiting"""
+    app.run_polling(timeout=POLL_TIMEOUT, allowed_updates=ALLOWED_UPDATES)
+
+
+async def wait_for_stop():
+    """Block until Ctrl+C or SIGTERM (for code that manages the loop itself)"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass  # Windows: Ctrl+C still raises KeyboardInterrupt
+    await stop.wait()
@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import heapq
+import asyncio
+import traceback
+from dotenv import load_dotenv
+from forecast_cache import next_run_at
+from forecast_batcher import BATCH_MAX_POINTS
+from state_backend import StateBackendError
+
+# ============ CONFIGURATION ============
+load_dotenv()
+# Upstream calls spent per model run; each call carries up to BATCH_MAX_POINTS cells. 0 disables
+PREFETCH_MAX_CALLS = int(os.getenv("PREFETCH_MAX_CALLS", 10))
+# Requests fade with this half-life, so yesterday's morning rush still counts today
+PREFETCH_HALF_LIFE_HOURS = float(os.getenv("PREFETCH_HALF_LIFE_HOURS", 48))
+# Cells need about this many recent requests to be worth an upstream point
+PREFETCH_MIN_SCORE = float(os.getenv("PREFETCH_MIN_SCORE", 2))
+# Breather between prefetch calls so interactive misses keep the upstream to themselves
+PREFETCH_PAUSE_SECONDS = float(os.getenv("PREFETCH_PAUSE_SECONDS", 1))
+# Request history survives redeploys here; empty keeps it in memory only
+PREFETCH_STATE_PATH = os.getenv("PREFETCH_STATE_PATH", "prefetch.json")
+PREFETCH_FORGET_SCORE = 0.01
+# With shared state every replica publishes its demand at each run, then waits this long before
+# one of them claims the run and prefetches for the combined demand
+PREFETCH_PUBLISH_WAIT_SECONDS = float(os.getenv("PREFETCH_PUBLISH_WAIT_SECONDS", 5))
+PREFETCH_DEMAND_MAX_AGE = 24 * 3600      # demand from replicas silent this long is dropped
+SHARED_DEMAND = "prefetch:demand"         # hash: replica id -> JSON of its decayed request counts
+
+
+# ============ PREFETCHER ============
+class Prefetcher:
+    """Refreshes the most requested grid cells right after each model run, before farmers ask"""
+
+    def __init__(self, cache, breaker=None, shared=None, max_calls=PREFETCH_MAX_CALLS,
+                 points_per_call=BATCH_MAX_POINTS, half_life_hours=PREFETCH_HALF_LIFE_HOURS,
+                 min_score=PREFETCH_MIN_SCORE, path=PREFETCH_STATE_PATH):
+        self.cache = cache
+        self.breaker = breaker
+        self.shared = shared
+        self.max_calls = max_calls
+        self.points_per_call = points_per_call
+        self.half_life = half_life_hours * 3600
+        self.min_score = min_score
+        self.path = path
+        self._cells = {}     # cell -> [decayed request count, time of last update]
+        self._replica = os.urandom(6).hex()
+        self._task = None
+        self.runs = 0
+        self.prefetched = 0
+        self.already_fresh = 0
+        self.failures = 0
+        self.skipped = 0
+
+    def record(self, lat, lon):
+        """Count an interactive request (hot path: one dict lookup and a pow)"""
+        cell = self.cache.cell(lat, lon)
+        now = time.time()
+        entry = self._cells.get(cell)
+        if entry is None:
+            self._cells[cell] = [1.0, now]
+        else:
+            entry[0] = entry[0] * 0.5 ** ((now - entry[1]) / self.half_life) + 1
+            entry[1] = now
+
+    def scores(self, now=None):
+        """{cell: decayed request count} seen by this replica, forgetting cells that went quiet"""
+        now = time.time() if now is None else now
+        scores = {}
+        for cell, (score, updated) in list(self._cells.items()):
+            score *= 0.5 ** ((now - updated) / self.half_life)
+            if score < PREFETCH_FORGET_SCORE:
+                del self._cells[cell]
+            else:
+                scores[cell] = score
+        return scores
+
+    def hottest(self, limit, scores=None):
+        """Up to limit cells by decayed request count (this replica's unless scores are given)"""
+        scores = self.scores() if scores is None else scores
+        scored = [(score, cell) for cell, score in scores.items() if score >= self.min_score]
+        return [cell for _, cell in heapq.nlargest(limit, scored)]
+
+    # ---- lifecycle ----
+    def start(self):
+        if self.max_calls <= 0:
+            return
+        self.load()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            self.save()
+            if self.shared is not None:
+                # The next process loads prefetch.json and publishes under a new id
+                try:
+                    await self.shared.hdel(SHARED_DEMAND, self._replica)
+                except StateBackendError:
+                    pass
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                for lat, lon, score, updated in json.load(f):
+                    self._cells[(lat, lon)] = [score, updated]
+        except (OSError, ValueError, TypeError) as e:
+            print(f"⚠️ Prefetch history not loaded: {e}")
+
+    def save(self):
+        if not self.path:
+            return
+        rows = [[cell[0], cell[1], score, updated] for cell, (score, updated) in self._cells.items()]
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(rows, f)
+        os.replace(tmp_path, self.path)
+
+    async def _run(self):
+        while True:
+            run_at = next_run_at(run_hours=self.cache.run_hours, delay_minutes=self.cache.run_delay_minutes)
+            await asyncio.sleep(max(1, run_at - time.time()))
+            try:
+                if self.shared is not None:
+                    await self.publish()
+                    await asyncio.sleep(PREFETCH_PUBLISH_WAIT_SECONDS)
+                await self.prefetch(int(run_at))
+            except Exception:
+                traceback.print_exc()
+
+    async def _claim(self, run):
+        """With shared state, one replica prefetches each run for all of them"""
+        if self.shared is None:
+            return True
+        try:
+            return await self.shared.set(f"job:prefetch:{run}", b"1", ttl=3600, only_new=True)
+        except StateBackendError:
+            return True
+
+    # ---- shared demand (multiple replicas) ----
+    async def publish(self):
+        """Share this replica's request counts so whichever replica prefetches sees all demand"""
+        now = time.time()
+        rows = [[cell[0], cell[1], score] for cell, score in self.scores(now).items()]
+        try:
+            await self.shared.hset(SHARED_DEMAND, self._replica, json.dumps({"at": now, "cells": rows}))
+        except StateBackendError as e:
+            print(f"⚠️ Prefetch demand not shared: {e}")
+
+    async def demand(self):
+        """{cell: decayed request count} summed over every replica that published recently"""
+        now = time.time()
+        if self.shared is None:
+            return self.scores(now)
+        try:
+            published = await self.shared.hgetall(SHARED_DEMAND)
+        except StateBackendError as e:
+            print(f"⚠️ Shared prefetch demand unavailable, using this replica's: {e}")
+            return self.scores(now)
+        combined = {}
+        for replica, payload in published.items():
+            try:
+                entry = json.loads(payload)
+                rows = entry["cells"]
+                age = now - entry["at"]
+            except (ValueError, KeyError, TypeError):
+                continue
+            if age > PREFETCH_DEMAND_MAX_AGE:
+                await self._forget(replica)
+                continue
+            decay = 0.5 ** (age / self.half_life)
+            for lat, lon, score in rows:
+                combined[(lat, lon)] = combined.get((lat, lon), 0.0) + score * decay
+        return combined
+
+    async def _forget(self, replica):
+        try:
+            await self.shared.hdel(SHARED_DEMAND, replica)
+        except StateBackendError:
+            pass
+
+    async def prefetch(self, run=None):
+        """Load the current run for the hottest cells, one upstream call's worth at a time"""
+        if run is not None and not await self._claim(run):
+            return
+        started = time.time()
+        cells = self.hottest(self.max_calls * self.points_per_call, await self.demand())
+        batches = 0
+        for i in range(0, len(cells), self.points_per_call):
+            if self.breaker is not None and self.breaker.state != self.breaker.CLOSED:
+                # Open-Meteo is struggling; leave what's left to on-demand fetches
+                self.skipped += len(cells) - i
+                break
+            if batches:
+                await asyncio.sleep(PREFETCH_PAUSE_SECONDS)
+            # Issued together so the batcher packs them into a single upstream call
+            chunk = cells[i:i + self.points_per_call]
+            results = await asyncio.gather(*(self.cache.prefetch(cell) for cell in chunk),
+                                           return_exceptions=True)
+            batches += 1
+            for result in results:
+                if isinstance(result, Exception):
+                    self.failures += 1
+                elif result:
+                    self.prefetched += 1
+                else:
+                    self.already_fresh += 1
+        self.runs += 1
+        if cells:
+            print(f"🔮 Prefetch: {len(cells)} hot cells in {batches} batches, {time.time() - started:.1f}s")
+
+    def stats(self):
+        return {
+            "tracked_cells": len(self._cells),
+            "runs": self.runs,
+            "prefetched": self.prefetched,
+            "already_fresh": self.already_fresh,
+            "failures": self.failures,
+            "skipped": self.skipped
+        }
@@ -0,0 +1,215 @@
+import os
+import time
+import asyncio
+import argparse
+from collections import deque
+from dotenv import load_dotenv
+
+# ============ CONFIGURATION ============
+load_dotenv()
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", 5))             # consecutive failures to open
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", 30))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", 0.3))           # never hedge sooner than this
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", 20))
+HEDGE_MAX_RATIO = float(os.getenv("HEDGE_MAX_RATIO", 0.1))           # at most 10% extra calls
+
+
+class CircuitOpenError(Exception):
+    """Upstream is failing; calls are rejected until the breaker resets"""
+
+
+# ============ CIRCUIT BREAKER ============
+class CircuitBreaker:
+    """Opens after repeated failures, then lets a single trial call through after a pause"""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failures=BREAKER_FAILURES, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self.rejected = 0
+        self.opened = 0
+
+    def check(self):
+        """Raise CircuitOpenError unless a call may go upstream now"""
+        if self.state == self.CLOSED:
+            return
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN and not self._trial_running:
+            self._trial_running = True
+            return
+        self.rejected += 1
+        raise CircuitOpenError("Open-Meteo circuit breaker is open")
+
+    def success(self):
+        self._consecutive = 0
+        self._trial_running = False
+        self.state = self.CLOSED
+
+    def cancelled(self):
+        """The call was abandoned without an answer: neither success nor failure, but free the trial slot"""
+        self._trial_running = False
+
+    def failure(self):
+        self._consecutive += 1
+        self._trial_running = False
+        if self.state == self.HALF_OPEN or self._consecutive >= self.failures:
+            if self.state != self.OPEN:
+                self.opened += 1
+                print(f"🚨 Open-Meteo circuit open for {self.reset_seconds:.0f}s")
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+
+# ============ LATENCY TRACKING ============
+class LatencyTracker:
+    """Rolling window of call latencies"""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+
+    def add(self, seconds):
+        self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, q):
+        if not self._samples:
+            return 0.0
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+# ============ RESILIENT CALL ============
+class ResilientCall:
+    """Wraps an upstream coroutine with a circuit breaker and p95-hedged duplicate requests"""
+
+    def __init__(self, call, breaker=None, min_hedge_delay=HEDGE_MIN_DELAY,
+                 min_samples=HEDGE_MIN_SAMPLES, max_hedge_ratio=HEDGE_MAX_RATIO):
+        self.call = call
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyTracker()
+        self.min_hedge_delay = min_hedge_delay
+        self.min_samples = min_samples
+        self.max_hedge_ratio = max_hedge_ratio
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self):
+        """p95 latency, or None when hedging isn't warranted yet"""
+        if len(self.latency) < self.min_samples:
+            return None
+        if self.hedges >= self.calls * self.max_hedge_ratio:
+            return None
+        return max(self.min_hedge_delay, self.latency.percentile(0.95))
+
+    async def __call__(self, *args):
+        self.breaker.check()
+        self.calls += 1
+        started = time.monotonic()
+        try:
+            result = await self._hedged(args)
+        except Exception:
+            self.breaker.failure()
+            raise
+        except BaseException:
+            # Cancelled (handler gone, shutdown, lost hedge race): a half-open trial must not stay taken
+            self.breaker.cancelled()
+            raise
+        self.breaker.success()
+        self.latency.add(time.monotonic() - started)
+        return result
+
+    async def _hedged(self, args):
+        primary = asyncio.ensure_future(self.call(*args))
+        delay = self.hedge_delay()
+        if delay is None:
+            return await primary
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+
+        # Primary is slower than p95: race a duplicate and take whichever succeeds first
+        self.hedges += 1
+        hedge = asyncio.ensure_future(self.call(*args))
+        pending = {primary, hedge}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self):
+        return {
+            "breaker": self.breaker.state,
+            "breaker_opened": self.breaker.opened,
+            "breaker_rejected": self.breaker.rejected,
+            "calls": self.calls,
+            "p95_seconds": round(self.latency.percentile(0.95), 3),
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins
+        }
+
+
+# ============ SELF-CHECK ============
+async def check():
+    """Breaker edge cases that are hard to hit in production; returns the failed checks"""
+    failures = []
+
+    def expect(name, actual, wanted):
+        ok = actual == wanted
+        print(f"{'✅' if ok else '❌'} {name}: {actual!r}")
+        if not ok:
+            failures.append(name)
+
+    async def failing():
+        raise OSError("upstream down")
+
+    async def hanging():
+        await asyncio.Event().wait()
+
+    breaker = CircuitBreaker(failures=1, reset_seconds=0)
+    await asyncio.gather(ResilientCall(failing, breaker)(), return_exceptions=True)
+    expect("opens after a failure", breaker.state, CircuitBreaker.OPEN)
+
+    trial = asyncio.ensure_future(ResilientCall(hanging, breaker)())
+    await asyncio.sleep(0)
+    expect("half-open trial running", (breaker.state, breaker._trial_running), (CircuitBreaker.HALF_OPEN, True))
+    trial.cancel()
+    await asyncio.gather(trial, return_exceptions=True)
+    expect("cancelled trial frees the slot", breaker._trial_running, False)
+
+    async def answering():
+        return "ok"
+    try:
+        result = await ResilientCall(answering, breaker)()
+    except CircuitOpenError as e:
+        result = repr(e)
+    expect("next call allowed as the trial", result, "ok")
+    expect("breaker closes after it succeeds", breaker.state, CircuitBreaker.CLOSED)
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Circuit breaker and hedging self-check")
+    parser.add_argument("--check", action="store_true", help="run the breaker edge-case checks and exit")
+    args = parser.parse_args()
+    if args.check:
+        raise SystemExit(1 if asyncio.run(check()) else 0)
+    parser.print_help()
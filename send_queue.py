@@ -0,0 +1,264 @@
+import os
+import time
+import heapq
+import asyncio
+from collections import deque
+from telegram.error import RetryAfter
+from dotenv import load_dotenv
+from metrics import send_latency
+
+# ============ CONFIGURATION ============
+load_dotenv()
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", 28))    # Telegram allows ~30 msg/s per bot
+SEND_GLOBAL_BURST = float(os.getenv("SEND_GLOBAL_BURST", 30))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", 1))         # ~1 msg/s per chat
+SEND_CHAT_BURST = float(os.getenv("SEND_CHAT_BURST", 3))       # short replies may burst a little
+SEND_MAX_IN_FLIGHT = int(os.getenv("SEND_MAX_IN_FLIGHT", 32))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", 5))
+SEND_DRAIN_TIMEOUT = float(os.getenv("SEND_DRAIN_TIMEOUT", 30))
+
+# Lower value goes first
+INTERACTIVE = 0
+BROADCAST = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BROADCAST: "broadcast"}
+
+
+# ============ RATE LIMITING ============
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `capacity`"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """Seconds until one token is available"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Job:
+    __slots__ = ("method", "kwargs", "priority", "future", "enqueued", "attempts")
+
+    def __init__(self, method, kwargs, priority, future):
+        self.method = method
+        self.kwargs = kwargs
+        self.priority = priority
+        self.future = future
+        self.enqueued = time.monotonic()
+        self.attempts = 0
+
+
+# ============ OUTBOUND SENDER ============
+class OutboundSender:
+    """Single outbound pipeline for every bot message, respecting Telegram's flood limits"""
+
+    def __init__(self, global_rate=SEND_GLOBAL_RATE, global_burst=SEND_GLOBAL_BURST,
+                 chat_rate=SEND_CHAT_RATE, chat_burst=SEND_CHAT_BURST,
+                 max_in_flight=SEND_MAX_IN_FLIGHT, max_retries=SEND_MAX_RETRIES):
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.bot = None
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._chats = {}        # chat_id -> deque of jobs, in send order
+        self._buckets = {}      # chat_id -> TokenBucket
+        self._ready = []        # heap of (priority, seq, chat_id)
+        self._waiting = []      # heap of (ready_at, chat_id) throttled by their chat bucket
+        self._busy = set()      # chats with a message on the wire
+        self._seq = 0
+        self._paused_until = 0.0
+        self._wake = asyncio.Event()
+        self._task = None
+        self._deliveries = set()
+        self._last_prune = time.monotonic()
+        # Metrics
+        self.sent = 0
+        self.failed = 0
+        self.retry_after = 0
+        self._latency = {p: deque(maxlen=1000) for p in PRIORITY_NAMES}
+        self._sent_times = deque(maxlen=10000)
+
+    def start(self, bot):
+        self.bot = bot
+        self._task = asyncio.create_task(self._dispatch())
+
+    async def stop(self, timeout=SEND_DRAIN_TIMEOUT):
+        """Flush queued messages (up to `timeout` seconds), then stop"""
+        deadline = time.monotonic() + timeout
+        while (self._chats or self._deliveries) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def submit(self, chat_id, method="send_message", priority=INTERACTIVE, **kwargs):
+        """Queue a Bot API call for a chat; returns a future with its result"""
+        future = asyncio.get_running_loop().create_future()
+        job = _Job(method, kwargs, priority, future)
+        jobs = self._chats.get(chat_id)
+        if jobs is None:
+            jobs = self._chats[chat_id] = deque()
+            jobs.append(job)
+            self._push_ready(chat_id)
+        else:
+            jobs.append(job)
+        return future
+
+    async def send(self, chat_id, text, priority=INTERACTIVE, **kwargs):
+        """Send a text message and wait until Telegram accepted it"""
+        return await self.submit(chat_id, "send_message", priority, text=text, **kwargs)
+
+    def _push_ready(self, chat_id, seq=None):
+        """Make a chat eligible to send; a retry passes its old seq to keep its place in line"""
+        if chat_id in self._busy:
+            return
+        if seq is None:
+            self._seq += 1
+            seq = self._seq
+        heapq.heappush(self._ready, (self._chats[chat_id][0].priority, seq, chat_id))
+        self._wake.set()
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def _dispatch(self):
+        while True:
+            now = time.monotonic()
+            while self._waiting and self._waiting[0][0] <= now:
+                _, chat_id = heapq.heappop(self._waiting)
+                self._push_ready(chat_id)
+            if now - self._last_prune > 60:
+                self._prune(now)
+
+            if self._paused_until > now:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            if not self._ready:
+                self._wake.clear()
+                timeout = self._waiting[0][0] - now if self._waiting else None
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            delay = self.global_bucket.delay(now)
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            _, seq, chat_id = heapq.heappop(self._ready)
+            delay = self._chat_bucket(chat_id).delay(now)
+            if delay > 0:
+                heapq.heappush(self._waiting, (now + delay, chat_id))
+                continue
+
+            await self._in_flight.acquire()
+            if self._paused_until > time.monotonic():
+                # Flood control hit while we waited for a slot; keep this chat's place in line
+                self._in_flight.release()
+                self._push_ready(chat_id, seq)
+                continue
+            self.global_bucket.take(now)
+            self._buckets[chat_id].take(now)
+            job = self._chats[chat_id].popleft()
+            self._busy.add(chat_id)
+            task = asyncio.create_task(self._deliver(chat_id, job, seq))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+
+    async def _deliver(self, chat_id, job, seq):
+        jobs = self._chats[chat_id]
+        started = time.perf_counter()
+        retry = False
+        try:
+            result = await getattr(self.bot, job.method)(chat_id=chat_id, **job.kwargs)
+        except RetryAfter as e:
+            # Flood control applies to the whole bot: pause everything, then retry this one
+            # ahead of everything else queued at its priority
+            self.retry_after += 1
+            job.attempts += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + float(e.retry_after))
+            print(f"⏸️ Telegram flood control: pausing sends for {e.retry_after}s")
+            if job.attempts <= self.max_retries:
+                jobs.appendleft(job)
+                retry = True
+            else:
+                self.failed += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+        except Exception as e:
+            self.failed += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            self.sent += 1
+            now = time.monotonic()
+            self._latency[job.priority].append(now - job.enqueued)
+            self._sent_times.append(now)
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            send_latency.since(started)
+            self._in_flight.release()
+            self._busy.discard(chat_id)
+            if jobs:
+                self._push_ready(chat_id, seq if retry else None)
+            else:
+                del self._chats[chat_id]
+        # Nobody awaited a failed broadcast future; don't warn about it
+        if job.future.done() and not job.future.cancelled():
+            job.future.exception()
+
+    def _prune(self, now):
+        """Forget chats whose bucket has fully refilled"""
+        self._last_prune = now
+        for chat_id in [c for c, b in self._buckets.items() if c not in self._chats and b.full(now)]:
+            del self._buckets[chat_id]
+
+    def stats(self):
+        now = time.monotonic()
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for jobs in self._chats.values():
+            for job in jobs:
+                depth[PRIORITY_NAMES[job.priority]] += 1
+        latency = {}
+        for priority, samples in self._latency.items():
+            ordered = sorted(samples)
+            latency[PRIORITY_NAMES[priority]] = {
+                "p50": round(ordered[len(ordered) // 2], 3) if ordered else 0.0,
+                "p95": round(ordered[int(len(ordered) * 0.95)], 3) if ordered else 0.0
+            }
+        recent = sum(1 for t in self._sent_times if now - t <= 60)
+        return {
+            "queued": depth,
+            "chats_waiting": len(self._chats),
+            "in_flight": len(self._deliveries),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retry_after": self.retry_after,
+            "paused_seconds": round(max(0.0, self._paused_until - now), 1),
+            "messages_per_second_1m": round(recent / 60, 2),
+            "queue_latency_seconds": latency
+        }
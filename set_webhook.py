@@ -1,64 +1,125 @@
 import os
-import requests
+import sys
+import argparse
+from datetime import datetime
+import httpx
 from dotenv import load_dotenv
+from update_filter import ALLOWED_UPDATES
 
-# Load environment variables
+# ============ CONFIGURATION ============
 load_dotenv()
 TOKEN = os.getenv('TELEGRAM_TOKEN')
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot")
+# Public base URL of the web service; Railway exposes its domain as RAILWAY_STATIC_URL
+RAILWAY_STATIC_URL = os.getenv("RAILWAY_STATIC_URL")
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL") or (f"https://{RAILWAY_STATIC_URL}" if RAILWAY_STATIC_URL else "")
+# Parallel connections Telegram may open to us (1-100, Telegram's default is 40). Updates are
+# acknowledged as soon as they are queued, so more connections means less delivery lag at peaks
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", 100))
+# Telegram echoes it in every request so forged or scanner traffic can be refused unread;
+# 1-256 characters of A-Z, a-z, 0-9, _ and -
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
 
-# ⚠️ IMPORTANT: REPLACE THIS WITH YOUR ACTUAL RAILWAY URL!
-RAILWAY_URL = "https://meghdoot.up.railway.app/"  # CHANGE THIS!
-
-# Construct webhook URL
-webhook_url = f"{RAILWAY_URL}/{TOKEN}"
-api_url = f"https://api.telegram.org/bot{TOKEN}/setWebhook"
-
-print("=" * 60)
-print("🔧 MEGHDOOT WEBHOOK SETUP")
-print("=" * 60)
-print(f"🤖 Bot Token: {TOKEN[:10]}...{TOKEN[-5:]}")
-print(f"🌐 Railway URL: {RAILWAY_URL}")
-print(f"📡 Webhook URL: {webhook_url}")
-print()
-
-# Set webhook
-try:
-    response = requests.post(api_url, json={"url": webhook_url}, timeout=10)
-    
-    if response.status_code == 200:
-        result = response.json()
-        if result.get("ok"):
-            print("✅✅✅ WEBHOOK SET SUCCESSFULLY! ✅✅✅")
-            print(f"\n📬 Your bot is live at:")
-            print(f"   {webhook_url}")
-            print(f"\n📱 Telegram Bot:")
-            print(f"   https://t.me/MeghdootWeatherBot")
-        else:
-            print(f"❌ Telegram API Error: {result.get('description')}")
-    else:
-        print(f"❌ HTTP Error {response.status_code}")
-        print(response.text)
-        
-except Exception as e:
-    print(f"❌ Error: {e}")
-
-print("=" * 60)
-
-# Verify webhook
-print("\n📊 Verifying webhook...")
-try:
-    check_url = f"https://api.telegram.org/bot{TOKEN}/getWebhookInfo"
-    response = requests.get(check_url)
+
+def webhook_url(base_url, token=TOKEN):
+    return f"{base_url.rstrip('/')}/{token}"
+
+
+def webhook_params(url, drop_pending_updates=False):
+    """setWebhook parameters, shared with the server's own registration at startup"""
+    params = {
+        "url": url,
+        "max_connections": WEBHOOK_MAX_CONNECTIONS,
+        "allowed_updates": ALLOWED_UPDATES,
+        "drop_pending_updates": drop_pending_updates,
+    }
+    if WEBHOOK_SECRET:
+        params["secret_token"] = WEBHOOK_SECRET
+    return params
+
+
+# ============ BOT API ============
+def call(client, method, **params):
+    response = client.post(f"{TELEGRAM_API_URL}{TOKEN}/{method}", json=params)
     data = response.json()
-    if data['ok']:
-        url = data['result'].get('url', 'Not set')
-        print(f"✅ Current webhook: {url}")
-        if url == webhook_url:
-            print("✅✅✅ VERIFICATION SUCCESSFUL! ✅✅✅")
-        else:
-            print("❌ Webhook URL mismatch!")
-    else:
-        print(f"❌ Failed to verify: {data}")
-except Exception as e:
-    print(f"❌ Verification error: {e}")
-print("=" * 60)
\ No newline at end of file
+    if not data.get("ok"):
+        raise RuntimeError(f"{method}: {data.get('description', response.status_code)}")
+    return data["result"]
+
+
+def check(info, expected):
+    """Differences between getWebhookInfo and what was registered"""
+    problems = []
+    if info.get("url") != expected["url"]:
+        problems.append(f"url is {info.get('url') or 'not set'}")
+    if info.get("max_connections", expected["max_connections"]) != expected["max_connections"]:
+        problems.append(f"max_connections is {info.get('max_connections')}")
+    # Telegram omits allowed_updates when every type is allowed
+    if sorted(info.get("allowed_updates", [])) != sorted(expected["allowed_updates"]):
+        problems.append(f"allowed_updates is {info.get('allowed_updates', 'all')}")
+    return problems
+
+
+def print_info(info):
+    print(f"📡 URL:             {info.get('url') or 'not set'}")
+    print(f"🔌 Max connections: {info.get('max_connections', '-')}")
+    print(f"📨 Allowed updates: {', '.join(info.get('allowed_updates', [])) or 'all'}")
+    print(f"⏳ Pending updates: {info.get('pending_update_count', 0)}")
+    if info.get("ip_address"):
+        print(f"🌐 Resolved IP:     {info['ip_address']}")
+    if info.get("last_error_date"):
+        print(f"❌ Last error:      {info.get('last_error_message')} ({_when(info['last_error_date'])})")
+    if info.get("last_synchronization_error_date"):
+        print(f"⚠️ Last sync error: {_when(info['last_synchronization_error_date'])}")
+
+
+def _when(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime('%d %b %I:%M %p')
+
+
+# ============ MAIN ============
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="set-webhook", description="Register and verify the Telegram webhook")
+    parser.add_argument("--url", default=WEBHOOK_BASE_URL, help="public base URL (default: $WEBHOOK_BASE_URL)")
+    parser.add_argument("--drop-pending", action="store_true", help="discard updates queued at Telegram")
+    parser.add_argument("--info", action="store_true", help="only show the current webhook")
+    args = parser.parse_args(argv)
+
+    if not TOKEN:
+        print("❌ TELEGRAM_TOKEN not found")
+        return 1
+    print("=" * 60)
+    print("🔧 MEGHDOOT WEBHOOK SETUP")
+    print("=" * 60)
+    with httpx.Client(timeout=10) as client:
+        try:
+            if not args.info:
+                if not args.url:
+                    print("❌ No URL: pass --url or set WEBHOOK_BASE_URL")
+                    return 1
+                if not WEBHOOK_SECRET:
+                    print("⚠️ WEBHOOK_SECRET not set: anyone who learns the URL can post updates")
+                params = webhook_params(webhook_url(args.url), args.drop_pending)
+                call(client, "setWebhook", **params)
+                print(f"✅ Webhook registered{' (pending updates dropped)' if args.drop_pending else ''}")
+            info = call(client, "getWebhookInfo")
+        except (httpx.HTTPError, ValueError, RuntimeError) as e:
+            print(f"❌ {e}")
+            return 1
+
+    print_info(info)
+    if args.info:
+        print("=" * 60)
+        return 0
+    problems = check(info, params)
+    for problem in problems:
+        print(f"❌ Mismatch: {problem}")
+    if not problems:
+        print("✅ VERIFICATION SUCCESSFUL")
+    print("=" * 60)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
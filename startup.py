@@ -0,0 +1,44 @@
+import time
+import importlib
+from contextlib import contextmanager
+
+# ============ STARTUP TIMING ============
+# Cold start to first reply is what a farmer waits for after Railway wakes the service
+_began = time.perf_counter()
+_phases = {}    # phase -> seconds, in the order they ran
+_ready = None
+
+
+@contextmanager
+def phase(name):
+    """Time one step of startup"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases[name] = _phases.get(name, 0.0) + time.perf_counter() - started
+
+
+def load(*modules):
+    """Import modules one phase each, so the report shows which dependency a cold start pays for"""
+    for name in modules:
+        with phase(f"import {name}"):
+            importlib.import_module(name)
+
+
+def ready():
+    """Mark the process as serving and print the startup report"""
+    global _ready
+    _ready = time.perf_counter() - _began
+    other = _ready - sum(_phases.values())
+    print(f"⏱️ Ready in {_ready * 1000:.0f} ms")
+    for name, seconds in _phases.items():
+        print(f"   {name:<32} {seconds * 1000:7.1f} ms")
+    print(f"   {'other (network, runtime)':<32} {other * 1000:7.1f} ms")
+
+
+def stats():
+    result = {name: round(seconds * 1000, 1) for name, seconds in _phases.items()}
+    if _ready is not None:
+        result["ready_ms"] = round(_ready * 1000, 1)
+    return result
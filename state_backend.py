@@ -0,0 +1,480 @@
+import os
+import time
+import heapq
+import asyncio
+import argparse
+from abc import ABC, abstractmethod
+from collections import deque
+from urllib.parse import urlparse
+from dotenv import load_dotenv
+
+# ============ CONFIGURATION ============
+load_dotenv()
+# Empty keeps all state in this process; "redis://[:password@]host:6379/0" shares it between
+# replicas, "memory://" exercises the shared code paths inside a single process
+STATE_BACKEND_URL = os.getenv("STATE_BACKEND_URL", "")
+STATE_BACKEND_TIMEOUT = float(os.getenv("STATE_BACKEND_TIMEOUT", 1))
+STATE_KEY_PREFIX = os.getenv("STATE_KEY_PREFIX", "meghdoot:")
+
+
+class StateBackendError(Exception):
+    """The shared state store could not be reached or rejected a command"""
+
+
+def _bytes(value):
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode()
+
+
+# ============ INTERFACE ============
+class StateBackend(ABC):
+    """Keys with TTLs, counters and hashes shared by every replica (a small subset of Redis)"""
+
+    @abstractmethod
+    async def get(self, key):
+        """bytes stored under key, or None"""
+
+    @abstractmethod
+    async def set(self, key, value, ttl=None, only_new=False):
+        """Store value, expiring after ttl seconds; with only_new, returns False if the key exists"""
+
+    @abstractmethod
+    async def delete(self, key):
+        """Remove key; 1 if it existed"""
+
+    @abstractmethod
+    async def delete_if(self, key, value):
+        """Remove key only while it still holds value (releasing a lock we own); 1 if removed"""
+
+    @abstractmethod
+    async def incr(self, key):
+        """Add one to an integer key, starting from 0; returns the new value"""
+
+    @abstractmethod
+    async def hset(self, name, field, value):
+        """Set one field of a hash; 1 if the field is new"""
+
+    @abstractmethod
+    async def hdel(self, name, field):
+        """Remove one field of a hash; 1 if it existed"""
+
+    @abstractmethod
+    async def hgetall(self, name):
+        """{field: value} as bytes"""
+
+    async def close(self):
+        pass
+
+    def stats(self):
+        return {}
+
+
+# ============ IN-MEMORY BACKEND ============
+class MemoryBackend(StateBackend):
+    """Process-local implementation, also the data behind the RESP stand-in server"""
+
+    def __init__(self):
+        self._keys = {}       # key -> (value, expires_at or None)
+        self._hashes = {}     # name -> {field: value}
+        self._expiry = []     # heap of (expires_at, key), swept as keys are written
+
+    def _live(self, key):
+        entry = self._keys.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.time():
+            del self._keys[key]
+            return None
+        return entry
+
+    def _sweep(self, now):
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, key = heapq.heappop(self._expiry)
+            entry = self._keys.get(key)
+            if entry is not None and entry[1] == expires_at:
+                del self._keys[key]
+
+    async def get(self, key):
+        entry = self._live(_bytes(key))
+        return entry[0] if entry else None
+
+    async def set(self, key, value, ttl=None, only_new=False):
+        key = _bytes(key)
+        now = time.time()
+        self._sweep(now)
+        if only_new and self._live(key) is not None:
+            return False
+        expires_at = now + ttl if ttl else None
+        self._keys[key] = (_bytes(value), expires_at)
+        if expires_at is not None:
+            heapq.heappush(self._expiry, (expires_at, key))
+        return True
+
+    async def delete(self, key):
+        key = _bytes(key)
+        return int(self._keys.pop(key, None) is not None or self._hashes.pop(key, None) is not None)
+
+    async def delete_if(self, key, value):
+        key = _bytes(key)
+        entry = self._live(key)
+        if entry is None or entry[0] != _bytes(value):
+            return 0
+        del self._keys[key]
+        return 1
+
+    async def incr(self, key):
+        key = _bytes(key)
+        entry = self._live(key)
+        value = int(entry[0]) + 1 if entry else 1
+        self._keys[key] = (_bytes(value), entry[1] if entry else None)
+        return value
+
+    async def hset(self, name, field, value):
+        fields = self._hashes.setdefault(_bytes(name), {})
+        field = _bytes(field)
+        added = field not in fields
+        fields[field] = _bytes(value)
+        return int(added)
+
+    async def hdel(self, name, field):
+        fields = self._hashes.get(_bytes(name), {})
+        return int(fields.pop(_bytes(field), None) is not None)
+
+    async def hgetall(self, name):
+        return dict(self._hashes.get(_bytes(name), {}))
+
+    def stats(self):
+        return {"keys": len(self._keys), "hashes": len(self._hashes)}
+
+
+# ============ REDIS PROTOCOL (RESP2) ============
+# Redis has no conditional delete, so delete_if runs this script server-side
+DELETE_IF_SCRIPT = "if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end return 0"
+
+
+def encode_command(args):
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        arg = _bytes(arg)
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+async def read_reply(reader):
+    """One RESP value; error replies are returned as StateBackendError so the stream stays in step"""
+    line = await reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("connection closed")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest
+    if kind == b"-":
+        return StateBackendError(rest.decode(errors="replace"))
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        size = int(rest)
+        if size < 0:
+            return None
+        return (await reader.readexactly(size + 2))[:-2]
+    if kind == b"*":
+        size = int(rest)
+        if size < 0:
+            return None
+        return [await read_reply(reader) for _ in range(size)]
+    raise ConnectionError(f"unexpected reply {line[:32]!r}")
+
+
+class RedisBackend(StateBackend):
+    """Redis client over one pipelined connection: commands are written back to back, replies matched in order"""
+
+    def __init__(self, host="localhost", port=6379, password=None, db=0,
+                 prefix=STATE_KEY_PREFIX, timeout=STATE_BACKEND_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.db = db
+        self.prefix = prefix.encode()
+        self.timeout = timeout
+        self._writer = None
+        self._reader_task = None
+        self._pending = deque()         # futures waiting for replies, in command order
+        self._connect_lock = None
+        self.commands = 0
+        self.errors = 0
+        self.connects = 0
+
+    def _key(self, key):
+        return self.prefix + _bytes(key)
+
+    async def _connect(self):
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            raise StateBackendError(f"cannot connect to {self.host}:{self.port}: {e!r}") from e
+        self._writer = writer
+        self._reader_task = asyncio.create_task(self._read_replies(reader, writer))
+        self.connects += 1
+        if self.password:
+            await self.command("AUTH", self.password)
+        if self.db:
+            await self.command("SELECT", self.db)
+
+    async def _read_replies(self, reader, writer):
+        try:
+            while True:
+                reply = await read_reply(reader)
+                future = self._pending.popleft()
+                if future.done():
+                    continue    # caller timed out; the reply is still consumed to keep order
+                if isinstance(reply, StateBackendError):
+                    future.set_exception(reply)
+                else:
+                    future.set_result(reply)
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, IndexError) as e:
+            self._disconnect(writer, e)
+
+    def _disconnect(self, writer, error):
+        if self._writer is writer:
+            self._writer = None
+        writer.close()
+        while self._pending:
+            future = self._pending.popleft()
+            if not future.done():
+                future.set_exception(StateBackendError(f"connection lost: {error!r}"))
+
+    async def command(self, *args):
+        if self._writer is None:
+            if self._connect_lock is None:
+                self._connect_lock = asyncio.Lock()
+            async with self._connect_lock:
+                if self._writer is None:
+                    await self._connect()
+        writer = self._writer
+        if writer is None:
+            raise StateBackendError("connection lost")
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(future)
+        writer.write(encode_command(args))
+        self.commands += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError as e:
+            self.errors += 1
+            raise StateBackendError(f"{args[0]} timed out after {self.timeout}s") from e
+        except StateBackendError:
+            self.errors += 1
+            raise
+
+    async def get(self, key):
+        return await self.command("GET", self._key(key))
+
+    async def set(self, key, value, ttl=None, only_new=False):
+        args = ["SET", self._key(key), value]
+        if ttl:
+            args += ["PX", max(1, int(ttl * 1000))]
+        if only_new:
+            args.append("NX")
+        return await self.command(*args) is not None
+
+    async def delete(self, key):
+        return await self.command("DEL", self._key(key))
+
+    async def delete_if(self, key, value):
+        return await self.command("EVAL", DELETE_IF_SCRIPT, 1, self._key(key), value)
+
+    async def incr(self, key):
+        return await self.command("INCR", self._key(key))
+
+    async def hset(self, name, field, value):
+        return await self.command("HSET", self._key(name), field, value)
+
+    async def hdel(self, name, field):
+        return await self.command("HDEL", self._key(name), field)
+
+    async def hgetall(self, name):
+        flat = await self.command("HGETALL", self._key(name))
+        return dict(zip(flat[::2], flat[1::2]))
+
+    async def close(self):
+        if self._writer is not None:
+            self._disconnect(self._writer, "closed")
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            await asyncio.gather(self._reader_task, return_exceptions=True)
+            self._reader_task = None
+
+    def stats(self):
+        return {"commands": self.commands, "errors": self.errors,
+                "connects": self.connects, "in_flight": len(self._pending)}
+
+
+# ============ LOCAL STAND-IN SERVER ============
+class RespServer:
+    """Speaks enough of the Redis protocol for RedisBackend, backed by a MemoryBackend"""
+
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryBackend()
+        self._server = None
+        self._clients = set()
+
+    async def start(self, host="127.0.0.1", port=6379):
+        self._server = await asyncio.start_server(self._serve, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            self.drop_clients()
+            await self._server.wait_closed()
+            self._server = None
+
+    def drop_clients(self):
+        """Close every client connection, as a Redis restart or failover would"""
+        for writer in list(self._clients):
+            writer.close()
+
+    async def _serve(self, reader, writer):
+        self._clients.add(writer)
+        try:
+            while True:
+                args = await read_reply(reader)
+                if not isinstance(args, list) or not args:
+                    break
+                writer.write(self._encode(await self._execute(args)))
+                await writer.drain()
+        except (OSError, ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+    async def _execute(self, args):
+        name, args = args[0].upper(), args[1:]
+        backend = self.backend
+        try:
+            if name in (b"PING", b"AUTH", b"SELECT"):
+                return "OK" if name != b"PING" else "PONG"
+            if name == b"GET":
+                return await backend.get(args[0])
+            if name == b"SET":
+                options = [a.upper() for a in args[2:]]
+                ttl = None
+                if b"PX" in options:
+                    ttl = int(args[2 + options.index(b"PX") + 1]) / 1000
+                elif b"EX" in options:
+                    ttl = int(args[2 + options.index(b"EX") + 1])
+                stored = await backend.set(args[0], args[1], ttl=ttl, only_new=b"NX" in options)
+                return "OK" if stored else None
+            if name == b"DEL":
+                return sum([await backend.delete(key) for key in args])
+            if name == b"EVAL" and args[0] == DELETE_IF_SCRIPT.encode() and args[1] == b"1":
+                return await backend.delete_if(args[2], args[3])
+            if name == b"INCR":
+                return await backend.incr(args[0])
+            if name == b"HSET":
+                return await backend.hset(args[0], args[1], args[2])
+            if name == b"HDEL":
+                return await backend.hdel(args[0], args[1])
+            if name == b"HGETALL":
+                return [item for pair in (await backend.hgetall(args[0])).items() for item in pair]
+        except (IndexError, ValueError):
+            return StateBackendError(f"ERR wrong arguments for '{name.decode()}'")
+        return StateBackendError(f"ERR unknown command '{name.decode()}'")
+
+    @classmethod
+    def _encode(cls, value):
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, StateBackendError):
+            return b"-%s\r\n" % str(value).encode()
+        if isinstance(value, str):
+            return b"+%s\r\n" % value.encode()
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if isinstance(value, list):
+            return b"*%d\r\n" % len(value) + b"".join(cls._encode(item) for item in value)
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+# ============ SHARED INSTANCE ============
+def open_backend(url=STATE_BACKEND_URL):
+    """Backend for a URL, or None to keep state process-local"""
+    if not url:
+        return None
+    parsed = urlparse(url)
+    if parsed.scheme == "memory":
+        return MemoryBackend()
+    if parsed.scheme == "redis":
+        return RedisBackend(parsed.hostname or "localhost", parsed.port or 6379,
+                            parsed.password, int(parsed.path.lstrip("/") or 0))
+    raise ValueError(f"Unsupported STATE_BACKEND_URL: {url}")
+
+
+shared_state = open_backend()
+
+
+async def serve(host, port):
+    server = RespServer()
+    port = await server.start(host, port)
+    print(f"🗄️ State stand-in on redis://{host}:{port}")
+    await asyncio.Event().wait()
+
+
+async def check():
+    """Round-trip RedisBackend against the stand-in; returns the failed checks"""
+    server = RespServer()
+    port = await server.start("127.0.0.1", 0)
+    client = RedisBackend("127.0.0.1", port, prefix="check:")
+    failures = []
+
+    def expect(name, actual, wanted):
+        ok = actual == wanted
+        print(f"{'✅' if ok else '❌'} {name}: {actual!r}")
+        if not ok:
+            failures.append(name)
+
+    try:
+        expect("SET NX on a new key", await client.set("lock", b"a", ttl=0.2, only_new=True), True)
+        expect("SET NX on a taken key", await client.set("lock", b"b", ttl=0.2, only_new=True), False)
+        expect("GET", await client.get("lock"), b"a")
+        expect("delete_if with another value", await client.delete_if("lock", b"b"), 0)
+        expect("delete_if with our value", await client.delete_if("lock", b"a"), 1)
+        await client.set("lock", b"a", ttl=0.05)
+        await asyncio.sleep(0.1)
+        expect("GET after PX expiry", await client.get("lock"), None)
+        expect("INCR from nothing", await client.incr("version"), 1)
+        expect("INCR", await client.incr("version"), 2)
+        expect("HSET new field", await client.hset("subs", "42", "a"), 1)
+        expect("HSET existing field", await client.hset("subs", "42", "b"), 0)
+        await client.hset("subs", "43", "c")
+        expect("HGETALL", await client.hgetall("subs"), {b"42": b"b", b"43": b"c"})
+        expect("HDEL", await client.hdel("subs", "43"), 1)
+        replies = await asyncio.gather(*(client.incr("counter") for _ in range(50)))
+        expect("50 pipelined INCRs answered in order", replies == list(range(1, 51)), True)
+
+        server.drop_clients()
+        try:
+            await client.get("version")
+            expect("command on a dropped connection", "succeeded", "StateBackendError")
+        except StateBackendError:
+            expect("command on a dropped connection", "StateBackendError", "StateBackendError")
+        expect("reconnect after the drop", await client.get("version"), b"2")
+        expect("connections opened", client.connects, 2)
+    finally:
+        await client.close()
+        await server.stop()
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Redis-protocol stand-in for multi-replica testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--check", action="store_true", help="round-trip the Redis client against the stand-in and exit")
+    args = parser.parse_args()
+    if args.check:
+        raise SystemExit(1 if asyncio.run(check()) else 0)
+    asyncio.run(serve(args.host, args.port))
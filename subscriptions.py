@@ -0,0 +1,288 @@
+import os
+import time
+import sqlite3
+import asyncio
+import traceback
+from collections import namedtuple
+from dotenv import load_dotenv
+from forecast_cache import grid_cell, cell_center
+from geocoder import place_name
+from send_queue import BROADCAST
+from state_backend import StateBackendError
+
+# ============ CONFIGURATION ============
+load_dotenv()
+SUBSCRIPTIONS_DB = os.getenv("SUBSCRIPTIONS_DB", "subscriptions.db")
+DEFAULT_SEND_TIME = os.getenv("DEFAULT_SEND_TIME", "06:00")
+BROADCAST_FETCH_CONCURRENCY = int(os.getenv("BROADCAST_FETCH_CONCURRENCY", 50))
+
+Subscription = namedtuple("Subscription", "chat_id lat lon send_minute utc_offset")
+
+# Shared state keys: every subscription in one hash, plus a counter bumped on each change
+SHARED_SUBSCRIPTIONS = "subscriptions"
+SHARED_VERSION = "subscriptions:version"
+
+
+def parse_send_time(text):
+    """'6', '06:30' or '6:30' -> minutes after local midnight, None if invalid"""
+    try:
+        hours, _, minutes = text.strip().partition(":")
+        hours, minutes = int(hours), int(minutes or 0)
+    except ValueError:
+        return None
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        return None
+    return hours * 60 + minutes
+
+
+def format_send_time(minute):
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+# ============ REGISTRY ============
+class SubscriptionRegistry:
+    """Farm locations per chat, indexed by UTC send minute and forecast grid cell, kept in SQLite or shared state"""
+
+    def __init__(self, path=SUBSCRIPTIONS_DB, shared=None):
+        self.path = path
+        self.shared = shared
+        self._db = None
+        self._subs = {}       # chat_id -> Subscription
+        self._schedule = {}   # utc minute of day -> {cell: set(chat_id)}
+        self._by_cell = {}    # cell -> set(chat_id)
+        self._version = None  # shared version the indexes were built from
+        self._writes = set()  # shared writes still in flight
+        self._db_lock = asyncio.Lock()  # one SQLite write at a time, in call order
+
+    def load(self):
+        """Open the database and build the in-memory indexes"""
+        # Writes run in a worker thread so a slow fsync never stalls the event loop
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS subscriptions ("
+            "chat_id INTEGER PRIMARY KEY, lat REAL, lon REAL, "
+            "send_minute INTEGER, utc_offset INTEGER)"
+        )
+        self._db.commit()
+        for row in self._db.execute("SELECT chat_id, lat, lon, send_minute, utc_offset FROM subscriptions"):
+            self._index(Subscription(*row))
+        print(f"📬 {len(self._subs)} subscriptions loaded")
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def __len__(self):
+        return len(self._subs)
+
+    def get(self, chat_id):
+        return self._subs.get(chat_id)
+
+    async def subscribe(self, chat_id, lat, lon, send_minute, utc_offset=0):
+        sub = Subscription(chat_id, lat, lon, send_minute, utc_offset)
+        self._unindex(chat_id)
+        self._index(sub)
+        if self.shared is not None:
+            self._write_shared(chat_id, sub)
+            return sub
+        await self._write_db("INSERT OR REPLACE INTO subscriptions VALUES (?, ?, ?, ?, ?)",
+                             (chat_id, lat, lon, send_minute, utc_offset))
+        return sub
+
+    async def unsubscribe(self, chat_id):
+        if not self._unindex(chat_id):
+            return False
+        if self.shared is not None:
+            self._write_shared(chat_id, None)
+            return True
+        await self._write_db("DELETE FROM subscriptions WHERE chat_id = ?", (chat_id,))
+        return True
+
+    async def _write_db(self, sql, params):
+        # The indexes are already updated; the lock keeps one chat's writes in order on disk
+        async with self._db_lock:
+            await asyncio.to_thread(self._execute, sql, params)
+
+    def _execute(self, sql, params):
+        self._db.execute(sql, params)
+        self._db.commit()
+
+    # ---- shared state (multiple replicas) ----
+    def _write_shared(self, chat_id, sub):
+        task = asyncio.ensure_future(self._store_shared(chat_id, sub))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def _store_shared(self, chat_id, sub):
+        try:
+            if sub is None:
+                await self.shared.hdel(SHARED_SUBSCRIPTIONS, chat_id)
+            else:
+                await self.shared.hset(SHARED_SUBSCRIPTIONS, chat_id, ",".join(map(str, sub[1:])))
+            await self.shared.incr(SHARED_VERSION)
+        except StateBackendError as e:
+            print(f"⚠️ Subscription for {chat_id} not shared: {e}")
+
+    async def sync(self):
+        """Rebuild the indexes if another replica changed the subscriptions"""
+        if self.shared is None:
+            return
+        await self.flush()
+        version = await self.shared.get(SHARED_VERSION)
+        if version is None and self._subs:
+            # First replica on an empty backend: import what SQLite had
+            for sub in list(self._subs.values()):
+                await self._store_shared(sub.chat_id, sub)
+            version = await self.shared.get(SHARED_VERSION)
+        if version is None or version == self._version:
+            return
+        rows = await self.shared.hgetall(SHARED_SUBSCRIPTIONS)
+        self._subs, self._schedule, self._by_cell = {}, {}, {}
+        for chat_id, row in rows.items():
+            lat, lon, send_minute, utc_offset = row.decode().split(",")
+            self._index(Subscription(int(chat_id), float(lat), float(lon), int(send_minute), int(utc_offset)))
+        self._version = version
+
+    async def flush(self):
+        """Wait for shared writes still in flight"""
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
+
+    async def claim(self, key, ttl):
+        """True if this replica should run a once-per-deployment job (always, without shared state)"""
+        if self.shared is None:
+            return True
+        try:
+            return await self.shared.set(f"job:{key}", b"1", ttl=ttl, only_new=True)
+        except StateBackendError as e:
+            # A duplicate broadcast beats a missed one
+            print(f"⚠️ Shared state unavailable, running {key} here: {e}")
+            return True
+
+    def due(self, utc_minute):
+        """{cell: set(chat_id)} for subscribers whose local send time is this UTC minute"""
+        return self._schedule.get(utc_minute, {})
+
+    def cells(self):
+        """Every grid cell with at least one subscriber"""
+        return set(self._by_cell)
+
+    def subscribers(self, cell):
+        """Chats subscribed anywhere in a grid cell"""
+        return self._by_cell.get(cell, set())
+
+    @staticmethod
+    def _utc_minute(sub):
+        return (sub.send_minute - sub.utc_offset // 60) % 1440
+
+    def _index(self, sub):
+        self._subs[sub.chat_id] = sub
+        cell = grid_cell(sub.lat, sub.lon)
+        cells = self._schedule.setdefault(self._utc_minute(sub), {})
+        cells.setdefault(cell, set()).add(sub.chat_id)
+        self._by_cell.setdefault(cell, set()).add(sub.chat_id)
+
+    def _unindex(self, chat_id):
+        sub = self._subs.pop(chat_id, None)
+        if sub is None:
+            return False
+        minute = self._utc_minute(sub)
+        cells = self._schedule[minute]
+        cell = grid_cell(sub.lat, sub.lon)
+        cells[cell].discard(chat_id)
+        if not cells[cell]:
+            del cells[cell]
+        if not cells:
+            del self._schedule[minute]
+        self._by_cell[cell].discard(chat_id)
+        if not self._by_cell[cell]:
+            del self._by_cell[cell]
+        return True
+
+
+# ============ BROADCAST SCHEDULER ============
+class BroadcastScheduler:
+    """Sends each minute's due forecasts, fetching and rendering once per grid cell"""
+
+    def __init__(self, registry, get_forecast, render, sender, parse_mode=None):
+        self.registry = registry
+        self.get_forecast = get_forecast
+        self.render = render
+        self.sender = sender
+        self.parse_mode = parse_mode
+        self._task = None
+        self.sent = 0
+        self.failed = 0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        last = int(time.time() // 60)
+        while True:
+            await asyncio.sleep(60 - time.time() % 60)
+            now = int(time.time() // 60)
+            try:
+                await self.registry.sync()
+            except Exception:
+                traceback.print_exc()
+            # Catch up on any minute skipped while the loop was busy
+            for minute in range(last + 1, now + 1):
+                try:
+                    # One replica sends each minute's forecasts
+                    if await self.registry.claim(f"broadcast:{minute}", ttl=3600):
+                        await self.broadcast(minute % 1440)
+                except Exception:
+                    traceback.print_exc()
+            last = now
+
+    async def broadcast(self, utc_minute):
+        due = self.registry.due(utc_minute)
+        if not due:
+            return
+        started = time.time()
+        fetch_slots = asyncio.Semaphore(BROADCAST_FETCH_CONCURRENCY)
+
+        async def render_cell(cell):
+            lat, lon = cell_center(cell)
+            async with fetch_slots:
+                try:
+                    data = await self.get_forecast(lat, lon)
+                except Exception:
+                    return cell, None
+            return cell, self.render(data, place_name(lat, lon)) if data else None
+
+        # Snapshot so (un)subscribes during the run don't disturb iteration
+        cells = {cell: list(chats) for cell, chats in due.items()}
+        messages = dict(await asyncio.gather(*(render_cell(cell) for cell in cells)))
+
+        # Queue at broadcast priority; interactive replies still go first
+        count = 0
+        for cell, chats in cells.items():
+            text = messages.get(cell)
+            if text is None:
+                self.failed += len(chats)
+                continue
+            for chat_id in chats:
+                future = self.sender.submit(chat_id, "send_message", BROADCAST,
+                                            text=text, parse_mode=self.parse_mode)
+                future.add_done_callback(self._count)
+                count += 1
+        print(f"📬 Broadcast {format_send_time(utc_minute)} UTC: {count} messages queued, "
+              f"{len(cells)} cells in {time.time() - started:.1f}s")
+
+    def _count(self, future):
+        if future.cancelled() or future.exception() is not None:
+            self.failed += 1
+        else:
+            self.sent += 1
+
+    def stats(self):
+        return {"subscribers": len(self.registry), "sent": self.sent, "failed": self.failed}
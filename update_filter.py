@@ -0,0 +1,53 @@
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # orjson is optional; the stdlib parser is just slower
+    import json
+    _loads = json.loads
+
+# ============ CONFIGURATION ============
+# Registered with setWebhook/getUpdates so Telegram never sends edits, channel posts, etc.
+ALLOWED_UPDATES = ["message"]
+
+# Every update a handler can use carries one of these byte strings; neither is ever JSON-escaped
+_RAW_MARKERS = (b'"location"', b'"bot_command"')
+
+
+# ============ PRE-DISPATCH FILTER ============
+class UpdateFilter:
+    """Drops updates no handler wants before Update.de_json builds the object graph"""
+
+    def __init__(self, commands):
+        self.commands = {"/" + command.lower() for command in commands}
+        self.dropped_raw = 0
+        self.dropped_parsed = 0
+
+    def parse(self, body):
+        """Update dict worth dispatching, or None to acknowledge and drop it; raises ValueError on bad JSON"""
+        # Stickers, photos, plain chat and group noise never reach the JSON parser
+        if not any(marker in body for marker in _RAW_MARKERS):
+            self.dropped_raw += 1
+            return None
+        data = _loads(body)
+        if not isinstance(data, dict):
+            raise ValueError("update is not an object")
+        if self.wanted(data):
+            return data
+        self.dropped_parsed += 1
+        return None
+
+    def wanted(self, data):
+        message = data.get("message")
+        if not isinstance(message, dict):
+            return False   # edited messages, callbacks, channel posts: no handler
+        if "location" in message:
+            return True
+        text = message.get("text")
+        if not isinstance(text, str) or not text.startswith("/"):
+            return False
+        # "/start@MeghdootBot 06:30" -> "/start"; the handler still checks the bot name
+        command = text.split(None, 1)[0].split("@", 1)[0].lower()
+        return command in self.commands
+
+    def stats(self):
+        return {"dropped_raw": self.dropped_raw, "dropped_parsed": self.dropped_parsed}
@@ -0,0 +1,137 @@
+import os
+import time
+import asyncio
+import traceback
+from collections import OrderedDict
+from dotenv import load_dotenv
+from state_backend import StateBackendError
+
+# ============ CONFIGURATION ============
+load_dotenv()
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", 16))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", 1000))
+# How long the webhook waits for a free slot before asking Telegram to retry
+UPDATE_ENQUEUE_TIMEOUT = float(os.getenv("UPDATE_ENQUEUE_TIMEOUT", 2))
+UPDATE_DEDUPE_SIZE = int(os.getenv("UPDATE_DEDUPE_SIZE", 10000))
+# With a shared state backend, how long an update_id stays claimed by the replica that took it
+UPDATE_DEDUPE_SECONDS = float(os.getenv("UPDATE_DEDUPE_SECONDS", 600))
+
+QUEUED = "queued"
+DUPLICATE = "duplicate"
+FULL = "full"
+
+
+# ============ UPDATE QUEUE ============
+class UpdateQueue:
+    """Bounded queue of raw webhook updates drained by a pool of async workers"""
+
+    def __init__(self, process, workers=UPDATE_WORKERS, max_size=UPDATE_QUEUE_SIZE,
+                 enqueue_timeout=UPDATE_ENQUEUE_TIMEOUT, dedupe_size=UPDATE_DEDUPE_SIZE, shared=None):
+        self.process = process
+        self.shared = shared
+        self.workers = workers
+        self.max_size = max_size
+        self.enqueue_timeout = enqueue_timeout
+        self.dedupe_size = dedupe_size
+        self._queue = None
+        self._pending = OrderedDict()  # update_id -> enqueue time, oldest first
+        self._seen = OrderedDict()     # recent update_ids
+        self._tasks = []
+        self.processed = 0
+        self.failed = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.shared_errors = 0
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Finish everything already queued, then stop the workers"""
+        if self._queue is not None:
+            await self._queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _remember(self, update_id):
+        self._seen[update_id] = None
+        if len(self._seen) > self.dedupe_size:
+            self._seen.popitem(last=False)
+
+    async def put(self, update_id, payload):
+        """Queue an update; returns QUEUED, DUPLICATE or FULL"""
+        if update_id in self._seen:
+            self.duplicates += 1
+            return DUPLICATE
+        # Claim the id first so a retry arriving while we wait is dropped
+        self._remember(update_id)
+        if self.shared is not None and not await self._claim(update_id):
+            self.duplicates += 1
+            return DUPLICATE
+        self._pending[update_id] = time.monotonic()
+        try:
+            if self._queue.full():
+                # Backpressure: hold the request briefly, then let Telegram retry
+                await asyncio.wait_for(self._queue.put((update_id, payload)), self.enqueue_timeout)
+            else:
+                self._queue.put_nowait((update_id, payload))
+        except asyncio.TimeoutError:
+            self._seen.pop(update_id, None)
+            self._pending.pop(update_id, None)
+            if self.shared is not None:
+                # Telegram's redelivery may land on any replica
+                await self._release(update_id)
+            self.rejected += 1
+            return FULL
+        return QUEUED
+
+    async def _claim(self, update_id):
+        """False if another replica already took this update"""
+        try:
+            return await self.shared.set(f"update:{update_id}", b"1", ttl=UPDATE_DEDUPE_SECONDS, only_new=True)
+        except StateBackendError:
+            # Answering twice beats not answering
+            self.shared_errors += 1
+            return True
+
+    async def _release(self, update_id):
+        try:
+            await self.shared.delete(f"update:{update_id}")
+        except StateBackendError:
+            self.shared_errors += 1
+
+    async def _worker(self):
+        while True:
+            update_id, payload = await self._queue.get()
+            self._pending.pop(update_id, None)
+            try:
+                await self.process(payload)
+                self.processed += 1
+            except Exception:
+                self.failed += 1
+                print(f"❌ Update {update_id} failed")
+                traceback.print_exc()
+            finally:
+                self._queue.task_done()
+
+    def oldest_age(self):
+        """Seconds the oldest waiting update has been queued"""
+        for received_at in self._pending.values():
+            return round(time.monotonic() - received_at, 3)
+        return 0.0
+
+    def stats(self):
+        return {
+            "depth": self._queue.qsize() if self._queue else 0,
+            "max_size": self.max_size,
+            "oldest_age_seconds": self.oldest_age(),
+            "workers": self.workers,
+            "processed": self.processed,
+            "failed": self.failed,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "shared_errors": self.shared_errors
+        }
@@ -0,0 +1,102 @@
+import os
+import time
+import asyncio
+import httpx
+from dotenv import load_dotenv
+from forecast_record import decode_forecasts
+from metrics import upstream_latency
+
+# ============ CONFIGURATION ============
+load_dotenv()
+WEATHER_URL = os.getenv("WEATHER_URL", "https://api.open-meteo.com/v1/forecast")
+WEATHER_TIMEOUT = float(os.getenv("WEATHER_TIMEOUT", 10))
+WEATHER_CONNECT_TIMEOUT = float(os.getenv("WEATHER_CONNECT_TIMEOUT", 5))
+WEATHER_MAX_CONCURRENCY = int(os.getenv("WEATHER_MAX_CONCURRENCY", 20))
+WEATHER_KEEPALIVE = float(os.getenv("WEATHER_KEEPALIVE", 30))
+
+# Every handler asks for the same forecast shape
+HOURLY_VARIABLES = (
+    "temperature_2m",
+    "precipitation",
+    "relative_humidity_2m",
+    "wind_speed_10m",
+    "et0_fao_evapotranspiration"
+)
+FORECAST_PARAMS = {
+    "hourly": ",".join(HOURLY_VARIABLES),
+    "forecast_days": 3,
+    "timezone": "auto",
+    "timeformat": "unixtime"
+}
+
+# ============ SHARED CLIENT ============
+_client = None
+_client_loop = None
+_semaphore = None
+
+
+def get_client():
+    """Shared keep-alive connection pool, created on first use"""
+    global _client, _client_loop, _semaphore
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop:
+        # Connections belong to the loop that opened them
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(WEATHER_TIMEOUT, connect=WEATHER_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=WEATHER_MAX_CONCURRENCY,
+                max_keepalive_connections=WEATHER_MAX_CONCURRENCY,
+                keepalive_expiry=WEATHER_KEEPALIVE
+            ),
+            headers={"Accept-Encoding": "gzip"}
+        )
+        _client_loop = loop
+        _semaphore = asyncio.Semaphore(WEATHER_MAX_CONCURRENCY)
+    return _client
+
+
+async def fetch_forecast(lat, lon, timeout=None):
+    """Fetch a forecast from Open-Meteo without blocking the event loop, as a compact Forecast"""
+    client = get_client()
+    params = dict(FORECAST_PARAMS, latitude=lat, longitude=lon)
+    async with _semaphore:
+        started = time.perf_counter()
+        try:
+            r = await client.get(WEATHER_URL, params=params, timeout=timeout or httpx.USE_CLIENT_DEFAULT)
+        finally:
+            upstream_latency.since(started)
+    r.raise_for_status()
+    return decode_forecasts(r.content, HOURLY_VARIABLES)[0]
+
+
+async def fetch_forecasts(points, timeout=None):
+    """Fetch forecasts for many (lat, lon) points in one multi-location call"""
+    if len(points) == 1:
+        return [await fetch_forecast(*points[0], timeout=timeout)]
+    client = get_client()
+    params = dict(
+        FORECAST_PARAMS,
+        latitude=",".join(str(lat) for lat, lon in points),
+        longitude=",".join(str(lon) for lat, lon in points)
+    )
+    async with _semaphore:
+        started = time.perf_counter()
+        try:
+            r = await client.get(WEATHER_URL, params=params, timeout=timeout or httpx.USE_CLIENT_DEFAULT)
+        finally:
+            upstream_latency.since(started)
+    r.raise_for_status()
+    # Open-Meteo answers multi-location requests with a list in request order
+    results = decode_forecasts(r.content, HOURLY_VARIABLES)
+    if len(results) != len(points):
+        raise ValueError(f"Expected {len(points)} forecasts, got {len(results)}")
+    return results
+
+
+async def close(*args):
+    """Close the connection pool (usable as a post_shutdown hook)"""
+    global _client, _client_loop
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        _client_loop = None
@@ -0,0 +1,61 @@
+import weather_client
+from forecast_cache import ForecastCache
+from forecast_batcher import ForecastBatcher
+from forecast_store import ForecastStore, FORECAST_STORE
+from resilience import ResilientCall
+from state_backend import shared_state
+from prefetcher import Prefetcher
+
+# ============ FORECAST LOOKUP ============
+# Single lookup shared by every handler: memory cache first (stale entries
+# are served while they refresh), then the on-disk store, then cache misses
+# from all chats are batched into multi-location Open-Meteo calls guarded by
+# a circuit breaker and hedged when slower than p95. With a shared state
+# backend the replicas share one cache and fetch each cell only once
+upstream = ResilientCall(weather_client.fetch_forecasts)
+forecast_batcher = ForecastBatcher(fetch_many=upstream)
+forecast_store = ForecastStore() if FORECAST_STORE else None
+# Another replica's fetch lock lapses once its upstream call must have timed out
+fetch_lock_seconds = (weather_client.WEATHER_CONNECT_TIMEOUT + weather_client.WEATHER_TIMEOUT
+                      + forecast_batcher.window)
+forecast_cache = ForecastCache(loader=forecast_batcher.fetch, store=forecast_store, shared=shared_state,
+                               lock_seconds=fetch_lock_seconds)
+# Farmers' requests tell it which cells to refresh right after each model run
+prefetcher = Prefetcher(forecast_cache, breaker=upstream.breaker, shared=shared_state,
+                        points_per_call=forecast_batcher.max_points)
+
+
+async def get_forecast(lat, lon):
+    """Forecast for the grid cell containing (lat, lon), for a farmer's request"""
+    prefetcher.record(lat, lon)
+    return await forecast_cache.get(lat, lon)
+
+
+async def get_scheduled_forecast(lat, lon):
+    """Same lookup for broadcasts, which must not make a cell look popular to the prefetcher"""
+    return await forecast_cache.get(lat, lon)
+
+
+async def get_fresh_forecast(lat, lon):
+    """Forecast from the latest model run, never a stale one"""
+    return await forecast_cache.get_fresh(lat, lon)
+
+
+def stats():
+    """Cache counters for monitoring"""
+    stats = {
+        "forecast_cache": forecast_cache.stats(),
+        "forecast_batcher": forecast_batcher.stats(),
+        "upstream": upstream.stats(),
+        "prefetcher": prefetcher.stats()
+    }
+    if forecast_store is not None:
+        stats["forecast_store"] = forecast_store.stats()
+    return stats
+
+
+async def close(*args):
+    """Release upstream connections and the store (usable as a post_shutdown hook)"""
+    await weather_client.close()
+    if forecast_store is not None:
+        forecast_store.close()